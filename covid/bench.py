@@ -0,0 +1,316 @@
+"""Headless benchmarks of Home.py and the pages.
+
+    python -m covid.bench                  # run every scenario, compare with the baseline
+    python -m covid.bench --update         # ... and store the results as the new baseline
+    python -m covid.bench breakthrough_*   # only the matching scenarios
+
+Each scenario runs in its own interpreter, offline, against the files in
+``data/`` and with an empty image cache. The Dashboard's OWID feed is the
+stand-in ``covid.loadtest.synthetic_feed``, read from a ``file://`` URL
+into a temporary snapshot directory, and its scenario grid is built in a
+temporary directory before the run. A scenario is a script plus the
+widget values to set (tab bars, checkboxes, selectboxes). The script is
+driven through ``streamlit.testing`` where it exists (streamlit >= 1.28),
+otherwise run in bare mode with the widget functions answering from the
+scenario. For every scenario the suite records:
+
+* ``first``: the first run of the script at its defaults, in a new process;
+* ``scenario``: the runs that apply the widget values, one per value;
+* ``rerun``: one more run with nothing changed;
+* ``peak_rss_mb``: the process's peak resident memory;
+* stage timings of ``first`` + ``scenario``: time spent in the ``covid``
+  functions that load, join, compute, and build figures.
+
+A scenario regresses when a time exceeds the baseline by more than
+``TIME_TOLERANCE`` (and by ``TIME_SLACK`` seconds), or the peak RSS by more
+than ``RSS_TOLERANCE``. The exit status is 1 if any scenario regressed.
+"""
+import fnmatch
+import functools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from covid import datasets
+
+BASELINE = os.path.join(datasets.ROOT_DIR, "benchmarks", "baseline.json")
+TIME_TOLERANCE = 0.25
+TIME_SLACK = 0.05
+RSS_TOLERANCE = 0.15
+TIME_METRICS = ("first", "scenario", "rerun")
+
+PAGE1 = "pages/1_Vaccine_Distribution.py"
+PAGE2 = "pages/2_Efficacy.py"
+PAGE3 = "pages/3_Breakthrough_Infection.py"
+PAGE4 = "pages/4_Dashboard.py"
+
+# name -> (script, [(widget kind, key or label, value), ...], files it needs beyond the checked-in data)
+SCENARIOS = {
+    "home": ("Home.py", [], []),
+    "distribution_dataset": (PAGE1, [], []),
+    "distribution_world": (PAGE1, [("radio", "vaccine_distribution_tab", "World Dataset")], []),
+    "distribution_static_maps": (PAGE1, [
+        ("radio", "vaccine_distribution_tab", "Vaccine Distribution"),
+        ("radio", "vaccination_rates_view", "Static Maps"),
+        ("radio", "vaccine_distribution_view", "Static Maps"),
+    ], []),
+    "distribution_folium": (PAGE1, [
+        ("radio", "vaccine_distribution_tab", "Vaccine Distribution"),
+        ("checkbox", "Click here to see the interative folium map", True),
+    ], []),
+    "efficacy_table": (PAGE2, [("radio", "efficacy_view", "Infection")], []),
+    "efficacy_calculation": (PAGE2, [("radio", "efficacy_tab", "Vaccine Efficacy Calculation")],
+                             [datasets.MANUFACTURER_EFFICACY_XLSX]),
+    "breakthrough_folium": (PAGE3, [
+        ("checkbox", "Click here to visualize the distribution for average vaccine efficacy", True),
+        ("selectbox", "Select the average vaccine efficacy data for one variant:",
+         "Omicron Infection Efficacy"),
+    ], []),
+    "breakthrough_compute": (PAGE3, [("radio", "breakthrough_tab", "Compute Breakthrough Infection")], []),
+    "breakthrough_visualize": (PAGE3, [
+        ("radio", "breakthrough_tab", "Visualize Breakthrough Infection"),
+        ("multiselect", "Add country", ["Canada", "Germany", "India", "Brazil"]),
+    ], []),
+    "breakthrough_whatif": (PAGE3, [
+        ("radio", "breakthrough_tab", "What-if Scenarios"),
+        ("slider", "whatif_variant_Omicron", 80),
+        ("selectbox", "whatif_country", "Germany"),
+        ("slider", "whatif_coverage_Germany", 95.0),
+    ], []),
+    "dashboard": (PAGE4, [("selectbox", "Change Country", "Germany")], []),
+}
+
+
+def _stage_functions():
+    from covid import breakthrough, efficacy, images, joins, manufacturer, maps, owid, vaccines
+
+    return {
+        "load": [(datasets, name) for name in dir(datasets) if name.startswith("load_")]
+        + [(owid, "load_locations"), (owid, "load_country")],
+        "join": [(joins, "enrich_world"), (joins, "join_efficacy"), (joins, "join_vaccinations")],
+        "compute": [(efficacy, "latest_records"), (efficacy, "vaccine_efficacy_rows"),
+                    (efficacy, "country_average"), (breakthrough, "add_rates"),
+                    (vaccines, "usage"), (vaccines, "long_form"), (manufacturer, "panel")],
+        "figure": [(maps, "explore_html"), (images, "render")],
+    }
+
+
+def instrument(stages):
+    """Wrap the stage functions so their time is added to ``stages[stage]``.
+
+    Only the outermost instrumented call counts, so a join that loads data
+    is not counted twice. Figures the pages build with plotly directly are
+    timed when streamlit serializes them (``st.plotly_chart``).
+    """
+    import streamlit as st
+
+    local = threading.local()
+
+    def wrap(stage, function):
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            if getattr(local, "depth", 0):
+                return function(*args, **kwargs)
+            local.depth = 1
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                stages[stage] = stages.get(stage, 0) + time.perf_counter() - start
+                local.depth = 0
+        return timed
+
+    targets = _stage_functions()
+    targets["figure"].append((st, "plotly_chart"))
+    for stage, functions in targets.items():
+        for module, name in functions:
+            setattr(module, name, wrap(stage, getattr(module, name)))
+
+
+class _AppTestDriver:
+    def __init__(self, script):
+        from streamlit.testing.v1 import AppTest
+        self.app = AppTest.from_file(script, default_timeout=600)
+
+    def run(self):
+        self.app.run()
+        if self.app.exception:
+            raise RuntimeError(self.app.exception[0].value)
+
+    def set(self, kind, name, value):
+        widgets = getattr(self.app, kind)
+        matches = [w for w in widgets if w.key == name or w.label == name]
+        if not matches:
+            raise LookupError(f"no {kind} {name!r}")
+        matches[0].set_value(value)
+
+
+class _BareDriver:
+    """Stand-in for AppTest: runs the script in bare mode with widgets answering from ``values``."""
+
+    def __init__(self, script):
+        import streamlit as st
+
+        self.script = script
+        self.values = {}
+        for kind in ("radio", "checkbox", "selectbox", "multiselect", "slider"):
+            setattr(st, kind, self._widget(getattr(st, kind)))
+
+    def _widget(self, function):
+        @functools.wraps(function)
+        def widget(label, *args, **kwargs):
+            default = function(label, *args, **kwargs)
+            return self.values.get(kwargs.get("key"), self.values.get(label, default))
+        return widget
+
+    def run(self):
+        import runpy
+        runpy.run_path(self.script, run_name="__main__")
+
+    def set(self, kind, name, value):
+        self.values[name] = value
+
+
+def run_scenario(name):
+    """Metrics of one scenario in this process; see the module docstring."""
+    import logging
+    import resource
+
+    logging.disable(logging.WARNING)
+    script, actions, _ = SCENARIOS[name]
+    script = os.path.join(datasets.ROOT_DIR, script)
+    stages = {}
+    instrument(stages)
+    try:
+        driver = _AppTestDriver(script)
+    except ImportError:
+        driver = _BareDriver(script)
+
+    result = {}
+    start = time.perf_counter()
+    driver.run()
+    result["first"] = time.perf_counter() - start
+    start = time.perf_counter()
+    for kind, widget, value in actions:
+        driver.set(kind, widget, value)
+        driver.run()
+    result["scenario"] = time.perf_counter() - start
+    result["stages"] = dict(sorted(stages.items()))
+    start = time.perf_counter()
+    driver.run()
+    result["rerun"] = time.perf_counter() - start
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return result
+
+
+def measure(name):
+    """Run one scenario in a fresh interpreter; None when it needs files that are not here."""
+    missing = [p for p in SCENARIOS[name][2] if not os.path.exists(p)]
+    if missing:
+        print(f"skip {name}: missing {', '.join(os.path.basename(p) for p in missing)}")
+        return None
+    with tempfile.TemporaryDirectory() as scratch:
+        env = dict(os.environ, PYTHONPATH=datasets.ROOT_DIR, PYTHONWARNINGS="ignore",
+                   COVID_OFFLINE="1", COVID_IMAGE_CACHE_DIR=os.path.join(scratch, "images"))
+        env.pop("COVID_MAP_CACHE_DIR", None)
+        if SCENARIOS[name][0] == PAGE4:
+            env = _dashboard_inputs(scratch, env)
+        done = subprocess.run([sys.executable, "-m", "covid.bench", "--worker", name],
+                              cwd=datasets.ROOT_DIR, env=env, capture_output=True, text=True)
+    if done.returncode:
+        raise RuntimeError(f"scenario {name} failed:\n{done.stderr[-3000:]}")
+    return json.loads(done.stdout.strip().splitlines()[-1])
+
+
+def _dashboard_inputs(directory, env):
+    """``env`` plus a local OWID feed and a scenario grid for the Dashboard, both under ``directory``."""
+    from covid import loadtest
+
+    feed = os.path.join(directory, "vaccinations-by-manufacturer.csv")
+    with open(feed, "wb") as f:
+        f.write(loadtest.synthetic_feed())
+    # not offline: the snapshot is fetched from the file:// URL on first use
+    env = dict(env, COVID_OFFLINE="0", COVID_OWID_URL="file://" + feed,
+               COVID_OWID_CACHE_DIR=os.path.join(directory, "owid"),
+               COVID_SWEEP_DIR=os.path.join(directory, "sweep"))
+    # the grid is built ahead, as python -m covid.etl does, not by the page
+    subprocess.run([sys.executable, "-m", "covid.sweep"], cwd=datasets.ROOT_DIR, env=env, check=True,
+                   capture_output=True)
+    return env
+
+
+def regressions(result, baseline):
+    """Descriptions of the metrics in ``result`` that are worse than ``baseline`` allows."""
+    found = []
+    for metric in TIME_METRICS:
+        old, new = baseline.get(metric), result[metric]
+        if old is not None and new > old * (1 + TIME_TOLERANCE) and new - old > TIME_SLACK:
+            found.append(f"{metric} {old:.2f}s -> {new:.2f}s")
+    old, new = baseline.get("peak_rss_mb"), result["peak_rss_mb"]
+    if old is not None and new > old * (1 + RSS_TOLERANCE):
+        found.append(f"peak RSS {old:.0f}MB -> {new:.0f}MB")
+    return found
+
+
+def read_baseline(path=BASELINE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"scenarios": {}}
+
+
+def _rounded(value):
+    if isinstance(value, dict):
+        return {k: _rounded(v) for k, v in value.items()}
+    return round(value, 3) if isinstance(value, float) else value
+
+
+def write_baseline(results, path=BASELINE):
+    baseline = read_baseline(path)
+    baseline["machine"] = {"python": platform.python_version(), "platform": platform.platform(),
+                           "cpus": os.cpu_count()}
+    baseline["scenarios"].update(_rounded(results))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+    os.replace(tmp, path)
+
+
+def main(args):
+    if args[:1] == ["--worker"]:
+        print(json.dumps(run_scenario(args[1])))
+        return 0
+    update = "--update" in args
+    patterns = [a for a in args if not a.startswith("--")] or ["*"]
+    names = [n for n in SCENARIOS if any(fnmatch.fnmatch(n, p) for p in patterns)]
+    baseline = read_baseline()["scenarios"]
+
+    results, failed = {}, []
+    print(f"{'scenario':26} {'first':>6} {'scen.':>6} {'rerun':>6} {'RSS MB':>7}  stages (s)")
+    for name in names:
+        result = measure(name)
+        if result is None:
+            continue
+        results[name] = result
+        stages = " ".join(f"{k}={v:.2f}" for k, v in result["stages"].items())
+        worse = regressions(result, baseline.get(name, {}))
+        print(f"{name:26} {result['first']:6.2f} {result['scenario']:6.2f} {result['rerun']:6.2f} "
+              f"{result['peak_rss_mb']:7.0f}  {stages}" + (f"  REGRESSED: {'; '.join(worse)}" if worse else ""))
+        if worse:
+            failed.append(name)
+    if update:
+        write_baseline(results)
+        print(f"baseline written to {os.path.relpath(BASELINE, datasets.ROOT_DIR)}")
+    return 1 if failed and not update else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,21 @@
+"""Breakthrough infection, protection and infection rates per country."""
+from covid import timing
+from covid.joins import EFFICACY_VARIANTS
+
+
+@timing.timed("breakthrough rates")
+def add_rates(world, variants=EFFICACY_VARIANTS):
+    """Add the Breakthrough Infection / Protection / Infection columns for each variant.
+
+    ``world`` needs '% People Fully Vaccinated' and '<variant> Infection Efficacy'.
+    All values are percentages.
+    """
+    world = world.copy()
+    for v in variants:
+        world[f"{v} Breakthrough Infection"] = 100 - world[f"{v} Infection Efficacy"]
+    for v in variants:
+        world[f"{v} Protection"] = world["% People Fully Vaccinated"] * \
+            world[f"{v} Infection Efficacy"]/100
+    for v in variants:
+        world[f"{v} Infection"] = 100 - world[f"{v} Protection"]
+    return world
@@ -0,0 +1,296 @@
+"""Process-wide cache for the datasets the pages read.
+
+Every Streamlit rerun executes a page script from the top, so reading files
+directly means re-parsing the WHO xlsx and the shapefiles on every widget
+interaction. The loaders below parse each file once per server process and
+hand the same frame to every session until the file content changes.
+
+When ``data/binary/`` holds an up-to-date Parquet copy of a file (see
+``covid.storage``) the copy is read instead of the original.
+
+Frames returned from here are shared between sessions: treat them as
+read-only and take a ``.copy()`` before mutating. With
+``COVID_SHARED_DATA=1`` they are also shared between server processes
+(see ``covid.shared``), and their columns may be read-only arrays.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from covid import schema, shared, storage, timing
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT_DIR, "data")
+BINARY_DIR = os.path.join(DATA_DIR, "binary")
+
+WHO_VACCINATION_XLSX = os.path.join(
+    DATA_DIR, "vaccination-data-WHO-12-28-2022-NO-DETAILS for-vaciinetype-date.xlsx")
+EFFICACY_XLSX = os.path.join(DATA_DIR, "Covid-19 Vaccine Efficacy.xlsx")
+MANUFACTURER_EFFICACY_XLSX = os.path.join(
+    DATA_DIR, "vaccinations-by-manufacturer-with-vaccine-efficacy-KM.xlsx")
+WORLD_DATASET_CSV = os.path.join(DATA_DIR, "world_dataset.csv")
+WORLD_COVERAGE_PARQUET = os.path.join(DATA_DIR, "world_coverage.parquet")
+COUNTRY_EFFICACY_CSV = os.path.join(DATA_DIR, "country_efficacy.csv")
+INFECTION_SHP = os.path.join(DATA_DIR, "infection.shp")
+SHAPEFILE_SIDECARS = (".shx", ".dbf", ".prj", ".cpg")
+VACCINES_BY_COUNTRIES = ["AstraZeneca", "BBIBP", "Bharat", "Gamaleya", "JJ",
+                         "Moderna", "Novavax", "Pfizer", "Sinovac"]
+
+# upper bound for the frames kept in memory, in megabytes
+MEMORY_BUDGET_MB = float(os.environ.get("COVID_CACHE_MB", 512))
+
+_lock = threading.RLock()
+_frames = OrderedDict()  # (path, digest, reader, options) -> (frame, nbytes)
+_digests = {}  # path -> (mtime_ns, size, digest)
+
+
+def file_digest(path):
+    """Return the sha1 of the file content.
+
+    The digest is only recomputed when the file's mtime or size changes, so
+    calling this on every rerun costs a ``stat`` rather than a full read.
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    with _lock:
+        known = _digests.get(path)
+        if known is not None and known[:2] == (st.st_mtime_ns, st.st_size):
+            return known[2]
+    sha = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    with _lock:
+        _digests[path] = (st.st_mtime_ns, st.st_size, digest)
+    return digest
+
+
+def frame_nbytes(frame):
+    """Approximate in-memory size of a frame (or a tuple or list of frames) in bytes."""
+    if isinstance(frame, (tuple, list)):
+        return sum(frame_nbytes(item) for item in frame)
+    try:
+        return int(frame.memory_usage(deep=True).sum())
+    except (AttributeError, TypeError, ValueError):
+        return 0
+
+
+def source_digest(path):
+    """Digest of a dataset, covering the sidecar files of a shapefile."""
+    digest = file_digest(path)
+    root, ext = os.path.splitext(path)
+    if ext.lower() != ".shp":
+        return digest
+    parts = [digest] + [file_digest(root + side) for side in SHAPEFILE_SIDECARS
+                        if os.path.exists(root + side)]
+    return hashlib.sha1("".join(parts).encode()).hexdigest()
+
+
+def cached_read(path, reader, **options):
+    """Parse ``path`` with ``reader(path, **options)`` once per file content.
+
+    The result is kept until the file changes, ``invalidate`` is called, or
+    it is evicted (least recently used first) to stay under
+    ``MEMORY_BUDGET_MB``.
+    """
+    path = os.path.abspath(path)
+    key = (path, source_digest(path), _name(reader), tuple(sorted(options.items())))
+    with _lock:
+        if key in _frames:
+            _frames.move_to_end(key)
+            return _frames[key][0]
+
+    if shared.enabled():
+        name = repr((path, key[2], [(k, _name(v)) for k, v in key[3]]))
+        frame = shared.frame(name, key[1], lambda: reader(path, **options))
+    else:
+        frame = reader(path, **options)
+    return _remember(key, frame)
+
+
+def derived(name, build, *deps):
+    """``build()``, computed once per process for each value of ``deps``.
+
+    For what the pages derive the same way for every session, e.g. a join
+    of two datasets: kept here it is held once per process instead of once
+    per session (``sections.session_cached``), and with ``covid.shared`` on,
+    once for all processes. ``deps`` should identify the inputs, e.g. the
+    ``source_digest`` of the files ``build`` reads. Treat the value as
+    read-only.
+    """
+    key = ("derived:" + name, hashlib.sha1(repr(deps).encode()).hexdigest(), "", ())
+    with _lock:
+        if key in _frames:
+            _frames.move_to_end(key)
+            return _frames[key][0]
+    value = shared.frame(key[0], key[1], build) if shared.enabled() else build()
+    return _remember(key, value)
+
+
+def _name(value):
+    return getattr(value, "__qualname__", repr(value))
+
+
+def _remember(key, frame):
+    with _lock:
+        # drop frames parsed from an older version of the same file
+        for stale in [k for k in _frames if k[0] == key[0] and k[1] != key[1]]:
+            del _frames[stale]
+        _frames[key] = (frame, frame_nbytes(frame))
+        _evict()
+    return frame
+
+
+def _evict():
+    budget = MEMORY_BUDGET_MB * 1024 * 1024
+    total = sum(nbytes for _, nbytes in _frames.values())
+    # always keep the most recent entry, even if it alone is over budget
+    while total > budget and len(_frames) > 1:
+        _, (_, nbytes) = _frames.popitem(last=False)
+        total -= nbytes
+
+
+def invalidate(path=None):
+    """Forget cached frames for ``path``, or everything when ``path`` is None."""
+    with _lock:
+        if path is None:
+            _frames.clear()
+            _digests.clear()
+            return
+        path = os.path.abspath(path)
+        for key in [k for k in _frames if k[0] == path]:
+            del _frames[key]
+        _digests.pop(path, None)
+
+
+def cache_info():
+    """Return one row per cached frame with its source file and size."""
+    with _lock:
+        rows = [{"path": k[0] if k[0].startswith("derived:") else os.path.relpath(k[0], ROOT_DIR),
+                 "digest": k[1][:12],
+                 "reader": k[2], "rows": len(frame), "MB": nbytes / 1e6}
+                for k, (frame, nbytes) in _frames.items()]
+    return pd.DataFrame(rows, columns=["path", "digest", "reader", "rows", "MB"])
+
+
+def _compacted(path, parse, policy):
+    return schema.compact(parse(path), policy)
+
+
+def load_source(path, reader, policy=None):
+    """``cached_read`` that prefers the fresh Parquet copy of ``path`` if any.
+
+    ``policy`` names the ``covid.schema`` dtype policy applied to the parsed
+    frame, so the cached frame is already compact.
+    """
+    binary = storage.binary_path(path, BINARY_DIR)
+    if storage.is_fresh(binary, source_digest(path)):
+        path, reader = binary, storage.read_binary
+    if policy is None:
+        return cached_read(path, reader)
+    return cached_read(path, _compacted, parse=reader, policy=policy)
+
+
+def _read_geo(path, **options):
+    import geopandas
+    return geopandas.read_file(path, **options)
+
+
+def read_csv(path):
+    """CSV written by ``DataFrame.to_csv``, first column as the index."""
+    return pd.read_csv(path, index_col=0)
+
+
+def read_wkt_csv(path):
+    """CSV written from a GeoDataFrame, with the WKT ``geometry`` column parsed."""
+    import geopandas
+    frame = read_csv(path)
+    wkt = frame.pop("geometry").astype(object)
+    geometry = geopandas.GeoSeries.from_wkt(wkt.where(wkt.notna(), None), crs="EPSG:4326")
+    return geopandas.GeoDataFrame(frame, geometry=geometry)
+
+
+def read_geoparquet(path):
+    """GeoParquet written by ``covid.etl``: WKB geometry, columns typed as written."""
+    import geopandas
+    return geopandas.read_parquet(path)
+
+
+def naturalearth_path():
+    import geopandas
+    return geopandas.datasets.get_path('naturalearth_lowres')
+
+
+def by_countries_path(vaccine):
+    return os.path.join(DATA_DIR, f"{vaccine}_byCountries")
+
+
+def sources():
+    """Every dataset the app reads, as (path, reader) pairs."""
+    return [
+        (WHO_VACCINATION_XLSX, pd.read_excel),
+        (EFFICACY_XLSX, pd.read_excel),
+        (MANUFACTURER_EFFICACY_XLSX, pd.read_excel),
+        (naturalearth_path(), _read_geo),
+        (WORLD_DATASET_CSV, read_wkt_csv),
+        (COUNTRY_EFFICACY_CSV, read_csv),
+        (INFECTION_SHP, _read_geo),
+    ] + [(by_countries_path(v), read_wkt_csv) for v in VACCINES_BY_COUNTRIES]
+
+
+@timing.timed("load WHO vaccinations xlsx")
+def load_vaccinations():
+    """WHO vaccination data, one row per country."""
+    return load_source(WHO_VACCINATION_XLSX, pd.read_excel, "who_vaccinations")
+
+
+@timing.timed("load efficacy xlsx")
+def load_efficacy():
+    """Vaccine efficacy summary table (raw sheet, header rows included)."""
+    return load_source(EFFICACY_XLSX, pd.read_excel)
+
+
+@timing.timed("load manufacturer efficacy xlsx")
+def load_manufacturer_efficacy():
+    """Vaccinations by manufacturer with the efficacy columns attached."""
+    return load_source(MANUFACTURER_EFFICACY_XLSX, pd.read_excel)
+
+
+@timing.timed("load naturalearth")
+def load_naturalearth():
+    """Natural Earth low resolution country polygons shipped with GeoPandas."""
+    return load_source(naturalearth_path(), _read_geo, "naturalearth")
+
+
+@timing.timed("load world dataset")
+def load_world_dataset():
+    """World + WHO vaccination table written by ``python -m covid.etl``."""
+    return load_source(WORLD_DATASET_CSV, read_wkt_csv, "world_dataset")
+
+
+@timing.timed("load world coverage")
+def load_world_coverage():
+    """Every country with its share of people vaccinated, as the Breakthrough Infection page uses it."""
+    return cached_read(WORLD_COVERAGE_PARQUET, read_geoparquet)
+
+
+@timing.timed("load country efficacy")
+def load_country_efficacy():
+    """Dose-weighted average efficacy per country."""
+    return load_source(COUNTRY_EFFICACY_CSV, read_csv)
+
+
+@timing.timed("load infection shapefile")
+def load_infection():
+    """Breakthrough infection / protection rates per country, with geometry."""
+    return load_source(INFECTION_SHP, _read_geo, "infection")
+
+
+@timing.timed("load countries by vaccine")
+def load_by_countries(vaccine):
+    """Countries using one vaccine, as saved by the vaccine_distr notebook."""
+    return load_source(by_countries_path(vaccine), read_wkt_csv)
@@ -0,0 +1,92 @@
+"""Average vaccine efficacy per country, weighted by doses administered."""
+import numpy as np
+import pandas as pd
+
+from covid import timing
+
+# the efficacy sheet lists manufacturers with footnote markers; these are the
+# names used in the manufacturer sheet, row for row
+MANUFACTURER_NAMES = [np.nan, 'CanSino', 'Covaxin', 'Johnson&Johnson', 'Medicago', 'Moderna', 'Novavax',
+                      'Oxford/AstraZeneca', 'Pfizer/BioNTech', 'Sinopharm/Beijing', 'Sinovac', 'SKYCovione',
+                      'Sputnik V', 'Valneva', np.nan, np.nan]
+
+
+def clean_efficacy(df_efficacy):
+    """Efficacy sheet with ``Vaccine_Manufacturer`` renamed to match the manufacturer sheet."""
+    df_efficacy = df_efficacy.copy()
+    df_efficacy.Vaccine_Manufacturer = MANUFACTURER_NAMES
+    return df_efficacy
+
+
+def latest_records(df, keys=("Unnamed: 0", "Unnamed: 2"), date=None, skip_rows=1):
+    """Most recent row for every (country, vaccine) pair.
+
+    Defaults fit the manufacturer sheet, whose first row is a second header
+    row. For the OWID feed use ``keys=("location", "vaccine"), date="date",
+    skip_rows=0``. Without ``date`` the last row of each pair in file order
+    wins; with it the rows are first sorted (stably) by date. Rows come back
+    in their original order with the old row label in an ``index`` column.
+    """
+    df = df.iloc[skip_rows:].dropna(subset=list(keys))
+    if date is not None:
+        df = df.sort_values(date, kind="stable")
+    latest = df.drop_duplicates(subset=list(keys), keep="last").sort_index()
+    return latest.reset_index()
+
+
+def efficacy_matrix(df_efficacy):
+    """Vaccine x variant efficacy table, e.g. columns 'Alpha Infection', 'Omicron Severe Disease'.
+
+    ``df_efficacy`` is the cleaned efficacy sheet. Its first row names the
+    variant of every efficacy column, so the variant axis follows the sheet
+    and a new variant needs no code change.
+    """
+    header = df_efficacy.iloc[0]
+    columns = [c for c in df_efficacy.columns if isinstance(header[c], str)]
+    table = df_efficacy.iloc[1:].dropna(subset=["Vaccine_Manufacturer"])
+    table = table.set_index("Vaccine_Manufacturer")[columns].astype(float)
+    table.columns = [f"{header[c]} {c.split('.')[0]}" for c in columns]
+    table.columns.name = "variant"
+    return table
+
+
+def vaccine_doses(df_filtered, country="Unnamed: 0", vaccine="Unnamed: 2", doses="Unnamed: 3"):
+    """country / vaccine / total vaccinations columns of ``latest_records`` output."""
+    rows = df_filtered[[country, vaccine, doses]].copy()
+    rows.columns = ['country', 'vaccine', 'total vaccinations']
+    rows['total vaccinations'] = rows['total vaccinations'].astype(float)
+    return rows.reset_index(drop=True)
+
+
+@timing.timed("efficacy rows")
+def vaccine_efficacy_rows(df_filtered, df_efficacy):
+    """One row per (country, vaccine) with its total vaccinations and efficacy columns."""
+    rows = vaccine_doses(df_filtered)
+    matrix = efficacy_matrix(df_efficacy)
+    efficacies = matrix.reindex(rows['vaccine'].to_numpy()).reset_index(drop=True)
+    return pd.concat([rows, efficacies], axis=1)
+
+
+def dose_weights(rows):
+    """Country x vaccine matrix of each vaccine's share of a country's doses."""
+    doses = rows.pivot_table(index='country', columns='vaccine', values='total vaccinations',
+                             aggfunc='sum', fill_value=0.0)
+    return doses.div(doses.sum(axis=1), axis=0)
+
+
+@timing.timed("efficacy weighting")
+def country_average(df_filtered, df_efficacy):
+    """Efficacy per country: each vaccine's efficacy weighted by its share of doses.
+
+    Computed for every country and variant at once as the product of the
+    country x vaccine weight matrix and the vaccine x variant efficacy
+    matrix. Countries that used a vaccine missing from the efficacy sheet
+    get NaN.
+    """
+    weights = dose_weights(vaccine_doses(df_filtered))
+    matrix = efficacy_matrix(df_efficacy)
+    known = weights.columns.isin(matrix.index)
+    averages = weights.loc[:, known].to_numpy() @ matrix.loc[weights.columns[known]].to_numpy()
+    averages[weights.loc[:, ~known].to_numpy().sum(axis=1) > 0] = np.nan
+    averages = pd.DataFrame(averages, index=weights.index, columns=matrix.columns)
+    return averages.rename_axis(columns=None).reset_index()
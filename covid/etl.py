@@ -0,0 +1,138 @@
+"""Build the derived datasets the pages read.
+
+    python -m covid.etl                  # every step, in dependency order
+    python -m covid.etl infection        # only the named steps
+
+The pages used to write ``world_dataset.csv`` and ``country_efficacy.csv`` as
+a side effect of being viewed, and ``infection.shp`` came from the
+breakthrough notebook. Here each artifact is built once, from the raw files,
+and replaced atomically so a page never sees a half-written file.
+"""
+import os
+import sys
+
+from covid import breakthrough, datasets, efficacy, joins, schema, storage, sweep
+
+
+def world_vaccination(naturalearth, df_vaccine):
+    """Natural Earth countries with WHO vaccination numbers (Vaccine Distribution page)."""
+    world = joins.enrich_world(naturalearth, df_vaccine)
+    world = world[(world.pop_est > 0) & (world.name != "Antarctica")]
+    world = world[world.Persons_Fully_Vaccinated.notnull()]
+    world["% People Fully Vaccinated"] = world['Persons_Fully_Vaccinated'] / \
+        world['pop_est']*100
+    world["% People Vaccinated"] = world['persons_vaccinated'] / \
+        world['pop_est']*100
+    return world
+
+
+def country_efficacy(df_manufacturer, df_efficacy):
+    """Dose-weighted average efficacy per country (Efficacy page)."""
+    return efficacy.country_average(efficacy.latest_records(df_manufacturer),
+                                    efficacy.clean_efficacy(df_efficacy))
+
+
+def world_coverage(naturalearth, df_vaccine):
+    """Every Natural Earth country with its share of people vaccinated (Breakthrough Infection page).
+
+    Unlike ``world_vaccination``, countries without WHO numbers are kept
+    (they show as "no data" on the maps) and Eritrea's empty report is
+    treated as missing.
+    """
+    df_vaccine = df_vaccine[df_vaccine["COUNTRY"] != "Eritrea"]
+    world = joins.enrich_world(naturalearth, df_vaccine,
+                               columns=["Persons_Fully_Vaccinated", "persons_vaccinated"])
+    world = world[(world.pop_est > 0) & (world.name != "Antarctica")]
+    world["% People Fully Vaccinated"] = world['Persons_Fully_Vaccinated'] / \
+        world['pop_est']*100
+    world["% People Vaccinated"] = world['persons_vaccinated'] / \
+        world['pop_est']*100
+    world.index = range(len(world))
+    return world
+
+
+def infection(naturalearth, df_vaccine, df_country_efficacy):
+    """Breakthrough infection and protection rates per country (Breakthrough Infection page)."""
+    world = joins.join_efficacy(world_coverage(naturalearth, df_vaccine), df_country_efficacy)
+    return breakthrough.add_rates(world)
+
+
+def write_csv(frame, path):
+    tmp = path + ".tmp"
+    frame.to_csv(tmp)
+    os.replace(tmp, path)
+
+
+def write_geojson(frame, path):
+    # infection.shp has always been GeoJSON under a .shp name; keep it that way
+    tmp = path + ".tmp"
+    frame.to_file(tmp, driver="GeoJSON")
+    os.replace(tmp, path)
+
+
+def write_geoparquet(frame, path):
+    tmp = path + ".tmp"
+    frame.to_parquet(tmp)
+    os.replace(tmp, path)
+
+
+def build_world_dataset():
+    world = world_vaccination(datasets.load_naturalearth(), datasets.load_vaccinations())
+    write_csv(world, datasets.WORLD_DATASET_CSV)
+
+
+def build_world_coverage():
+    world = world_coverage(datasets.load_naturalearth(), datasets.load_vaccinations())
+    write_geoparquet(schema.compact(world, "world_coverage"), datasets.WORLD_COVERAGE_PARQUET)
+
+
+def build_country_efficacy():
+    averages = country_efficacy(datasets.load_manufacturer_efficacy(), datasets.load_efficacy())
+    write_csv(averages, datasets.COUNTRY_EFFICACY_CSV)
+
+
+def build_infection():
+    world = infection(datasets.load_naturalearth(), datasets.load_vaccinations(),
+                      datasets.load_country_efficacy())
+    write_geojson(world, datasets.INFECTION_SHP)
+
+
+def build_binary():
+    storage.convert_all()
+
+
+def build_sweep():
+    sweep.ensure()
+
+
+# (name, inputs, build); a step's inputs are produced by the steps before it
+STEPS = [
+    ("world_dataset", [datasets.WHO_VACCINATION_XLSX], build_world_dataset),
+    ("world_coverage", [datasets.WHO_VACCINATION_XLSX], build_world_coverage),
+    ("country_efficacy", [datasets.MANUFACTURER_EFFICACY_XLSX, datasets.EFFICACY_XLSX],
+     build_country_efficacy),
+    ("infection", [datasets.WHO_VACCINATION_XLSX, datasets.COUNTRY_EFFICACY_CSV], build_infection),
+    ("binary", [], build_binary),
+    ("sweep", [datasets.WORLD_COVERAGE_PARQUET, datasets.COUNTRY_EFFICACY_CSV], build_sweep),
+]
+
+
+def run(names=None):
+    """Run the named steps (all by default) in dependency order."""
+    known = [name for name, _, _ in STEPS]
+    unknown = set(names or []) - set(known)
+    if unknown:
+        raise ValueError(f"unknown step(s) {sorted(unknown)}; expected some of {known}")
+    for name, inputs, build in STEPS:
+        if names and name not in names:
+            continue
+        missing = [p for p in inputs if not os.path.exists(p)]
+        if missing:
+            print(f"skip {name}: missing {', '.join(os.path.basename(p) for p in missing)}")
+            continue
+        print(f"build {name}")
+        build()
+
+
+if __name__ == "__main__":
+    run(sys.argv[1:])
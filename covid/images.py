@@ -0,0 +1,151 @@
+"""Static (matplotlib) map images for the Vaccine Distribution page.
+
+The page used to redraw every choropleth and per-vaccine overlay map on each
+rerun, saving the overlays to ``iframe/*.png`` in the repository only to read
+them back. ``render`` returns PNG bytes for a list of map specs instead:
+each image is keyed by the digest of the data it shows and rendered only
+when that data changes. Misses are drawn in a process pool, since
+matplotlib is single-threaded and a batch of nine maps otherwise takes
+seconds. Rendered images are kept in memory and in ``data/cache/images``
+(``COVID_IMAGE_CACHE_DIR`` to put them elsewhere).
+
+``COVID_RENDER_WORKERS`` sets the pool size; 1 or less renders in-process.
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from covid import datasets, maps, timing
+
+CACHE_DIR = os.environ.get("COVID_IMAGE_CACHE_DIR",
+                           os.path.join(datasets.DATA_DIR, "cache", "images"))
+MAX_IMAGES = 64
+WORKERS = int(os.environ.get("COVID_RENDER_WORKERS", min(4, os.cpu_count() or 1)))
+
+_lock = threading.Lock()
+_images = OrderedDict()  # key -> PNG bytes
+_pool = None
+
+
+def choropleth(column, label, cmap):
+    """Spec of a map coloured by ``column`` with a horizontal colour bar labelled ``label``."""
+    return {"kind": "choropleth", "column": column, "label": label, "cmap": cmap}
+
+
+def overlay(rows, title, color):
+    """Spec of the world in light grey with the countries labelled ``rows`` in ``color``."""
+    return {"kind": "overlay", "rows": [int(r) for r in rows], "title": title, "color": color}
+
+
+def _draw(frame, spec):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    buffer = io.BytesIO()
+    if spec["kind"] == "choropleth":
+        fig, ax = plt.subplots(1, 1)
+        frame.plot(column=spec["column"], legend=True, ax=ax,
+                   legend_kwds={'label': spec["label"], 'orientation': "horizontal"},
+                   cmap=spec["cmap"])
+        ax.set_axis_off()
+        # what st.pyplot used to save
+        fig.savefig(buffer, format="png", dpi=200, bbox_inches="tight")
+    else:
+        ax = frame.plot(color='lightgrey')
+        ax.set_aspect('equal')
+        ax.set_axis_off()
+        ax.set_title(spec["title"])
+        frame.loc[spec["rows"]].plot(ax=ax, color=spec["color"])
+        fig = ax.figure
+        fig.savefig(buffer, format="png")
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def _subset(world, spec):
+    """The part of ``world`` a spec needs, so workers are not sent every column.
+
+    The value column is plain float64: matplotlib cannot colour by the
+    nullable integer columns of the compact dtypes.
+    """
+    if spec["kind"] != "choropleth":
+        return world[[world.geometry.name]]
+    return world[[spec["column"], world.geometry.name]].astype({spec["column"]: "float64"})
+
+
+def image_key(world, spec, geometry=None):
+    import pandas as pd
+
+    sha = hashlib.sha1((geometry or maps.geometry_digest(world)).encode())
+    sha.update(json.dumps(spec, sort_keys=True).encode())
+    if spec["kind"] == "choropleth":
+        sha.update(pd.util.hash_pandas_object(world[spec["column"]]).to_numpy().tobytes())
+    else:
+        sha.update(json.dumps([str(i) for i in world.index]).encode())
+    return sha.hexdigest()
+
+
+def _get_pool():
+    global _pool
+    import multiprocessing
+
+    with _lock:
+        if _pool is None:
+            # spawn, not fork: the Streamlit server process has threads running
+            _pool = ProcessPoolExecutor(WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _cached(key):
+    with _lock:
+        if key in _images:
+            _images.move_to_end(key)
+            return _images[key]
+    try:
+        with open(os.path.join(CACHE_DIR, key + ".png"), "rb") as f:
+            png = f.read()
+    except FileNotFoundError:
+        return None
+    _remember(key, png)
+    return png
+
+
+def _remember(key, png):
+    with _lock:
+        _images[key] = png
+        _images.move_to_end(key)
+        while len(_images) > MAX_IMAGES:
+            _images.popitem(last=False)
+
+
+def _store(key, png):
+    _remember(key, png)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = os.path.join(CACHE_DIR, key + ".png")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(png)
+    os.replace(tmp, path)
+
+
+@timing.timed("static maps")
+def render(world, specs):
+    """PNG bytes for each spec, in order; only maps whose data changed are drawn."""
+    geometry = maps.geometry_digest(world)
+    keys = [image_key(world, spec, geometry) for spec in specs]
+    pngs = [_cached(key) for key in keys]
+    missing = [i for i, png in enumerate(pngs) if png is None]
+    if len(missing) > 1 and WORKERS > 1:
+        futures = {i: _get_pool().submit(_draw, _subset(world, specs[i]), specs[i]) for i in missing}
+        drawn = {i: future.result() for i, future in futures.items()}
+    else:
+        drawn = {i: _draw(_subset(world, specs[i]), specs[i]) for i in missing}
+    for i, png in drawn.items():
+        _store(keys[i], png)
+        pngs[i] = png
+    return pngs
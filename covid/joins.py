@@ -0,0 +1,81 @@
+"""Joins between the Natural Earth world table, the WHO vaccination table and
+the per-country efficacy table.
+
+The pages used to fill these columns with a ``for i in range(world.shape[0])``
+loop that scanned the WHO table once per country and column. Here the right
+hand table is indexed once by its key and every column is picked up with a
+single ``reindex``; like the loops, the first row wins when a key repeats and
+countries without a match get NaN.
+"""
+from pandas.api.types import is_numeric_dtype
+
+from covid import timing
+
+# world column <- WHO column, in the order page 1 adds them
+WHO_COLUMNS = {
+    "Total_Vaccinations": "TOTAL_VACCINATIONS",
+    "vaccines": "VACCINES_USED",
+    "Persons_Fully_Vaccinated": "PERSONS_FULLY_VACCINATED",
+    "Total_Vaccinations_Per100": "TOTAL_VACCINATIONS_PER100",
+    "Persons_Fully_Vaccinated_Per100": "PERSONS_FULLY_VACCINATED_PER100",
+    "persons_vaccinated": "PERSONS_VACCINATED_1PLUS_DOSE",
+    "persons_vaccinated_per100": "PERSONS_VACCINATED_1PLUS_DOSE_PER100",
+}
+
+EFFICACY_VARIANTS = ("Alpha", "Delta", "Omicron")
+
+# efficacy table country name -> Natural Earth name
+COUNTRY_ALIASES = {"United States": "United States of America"}
+
+
+def lookup_join(frame, key, table, table_key, mapping):
+    """Return a copy of ``frame`` with ``table`` columns looked up by key.
+
+    ``mapping`` maps each new column name in the result to the column of
+    ``table`` it is taken from. Numeric columns come back as float64 so that
+    unmatched rows can hold NaN, matching what the old loops produced.
+    """
+    index = table.drop_duplicates(table_key).set_index(table_key)
+    matched = index[list(mapping.values())].reindex(frame[key].to_numpy())
+    out = frame.copy()
+    for dst, src in mapping.items():
+        values = matched[src]
+        if is_numeric_dtype(values):
+            values = values.astype("float64")
+        out[dst] = values.to_numpy()
+    return out
+
+
+@timing.timed("ISO3 join")
+def join_vaccinations(world, df_vaccine, columns=None):
+    """Attach WHO vaccination columns to ``world`` by ISO3 code.
+
+    ``columns`` selects which of ``WHO_COLUMNS`` to add (all by default).
+    """
+    if columns is None:
+        columns = list(WHO_COLUMNS)
+    mapping = {c: WHO_COLUMNS[c] for c in columns}
+    return lookup_join(world, "ISO3", df_vaccine, "ISO3", mapping)
+
+
+@timing.timed("efficacy join")
+def join_efficacy(frame, df_efficacy, variants=EFFICACY_VARIANTS, on="name"):
+    """Attach '<variant> Infection Efficacy' columns by country name."""
+    mapping = {f"{v} Infection Efficacy": f"{v} Infection" for v in variants}
+    df_efficacy = df_efficacy.assign(country=df_efficacy["country"].replace(COUNTRY_ALIASES))
+    return lookup_join(frame, on, df_efficacy, "country", mapping)
+
+
+def enrich_world(world, df_vaccine, df_efficacy=None, columns=None,
+                 variants=EFFICACY_VARIANTS):
+    """Natural Earth table with WHO vaccination (and optionally efficacy) columns.
+
+    ``world`` is the raw Natural Earth frame; ``iso_a3`` is renamed to
+    ``ISO3`` and ``gdp_per_cap`` is added before joining.
+    """
+    world = world.rename(columns={"iso_a3": "ISO3"})
+    world["gdp_per_cap"] = world.gdp_md_est / world.pop_est
+    world = join_vaccinations(world, df_vaccine, columns)
+    if df_efficacy is not None:
+        world = join_efficacy(world, df_efficacy, variants)
+    return world
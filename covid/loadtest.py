@@ -0,0 +1,522 @@
+"""Load test: concurrent sessions against local Streamlit servers.
+
+    python -m covid.loadtest                                   # 8 sessions for 60 s, every script
+    python -m covid.loadtest --sessions 32 --duration 120 --servers 2 dashboard
+    python -m covid.loadtest --url http://localhost:8501 breakthrough   # a server already running
+    COVID_SHARED_DATA=1 python -m covid.loadtest --servers 4   # memory with covid.shared on
+
+Starts ``--servers`` ``streamlit run Home.py`` processes on free ports.
+They get the OWID feed from a stand-in served by this process, with its
+snapshot in a temporary directory, so the test runs offline and leaves
+``data/cache`` alone; the Dashboard's scenario grid is built there too. The stand-in serves ``--owid-csv``, or else a feed
+made up from the WHO table. Other ``COVID_*`` settings are passed through.
+
+Each session talks to a server over Streamlit's websocket protocol, as a
+browser tab would. It opens its script's page, then repeats the script's
+steps until ``--duration`` is up. Each step sets one widget, reruns, and
+times the rerun until the server reports the script finished. Sessions
+wait between steps for an exponential think time with mean ``--think``
+seconds. They are started evenly over ``--ramp`` seconds and assigned to
+the servers in turn. A step's value can be ``ANY`` of the widget's
+options, or ``SOME`` of them, drawn with a per-session seed.
+
+The report gives the reruns, errors and p50/p95/p99 latency per script,
+the throughput, and the servers' RSS and PSS. Memory is read from Linux
+``/proc`` once a second, summed over each server's process tree.
+``--json PATH`` writes the report with the memory timeline.
+"""
+import asyncio
+import fnmatch
+import http.server
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+import numpy as np
+
+from covid import datasets
+
+ANY = "any"    # one of the widget's options
+SOME = "some"  # two to six of them
+
+# name -> (page url path, [(widget kind, key or label, value), ...])
+SCRIPTS = {
+    "dashboard": ("Dashboard", [
+        ("selectbox", "dashboard_country", ANY),
+        ("multiselect", "dashboard_infection_countries", SOME),
+        ("selectbox", "dashboard_infection_map", ANY),
+    ]),
+    "breakthrough": ("Breakthrough_Infection", [
+        ("radio", "breakthrough_tab", "Visualize Breakthrough Infection"),
+        ("multiselect", "breakthrough_countries", SOME),
+    ]),
+    "distribution": ("Vaccine_Distribution", [
+        ("radio", "vaccine_distribution_tab", ANY),
+    ]),
+}
+WIDGETS = ("selectbox", "multiselect", "radio", "checkbox")
+PERCENTILES = (50, 95, 99)
+TIMEOUT = 300
+
+
+class _Socket:
+    """The websocket client at hand: ``websockets``, else tornado's (Streamlit's own server)."""
+
+    @classmethod
+    async def connect(cls, url):
+        self = cls()
+        try:
+            import websockets
+        except ImportError:
+            from tornado.websocket import websocket_connect
+            self._tornado = await websocket_connect(url, max_message_size=1 << 30)
+            self._websockets = None
+        else:
+            self._websockets = await websockets.connect(url, max_size=None)
+        return self
+
+    async def send(self, data):
+        if self._websockets is not None:
+            await self._websockets.send(data)
+        else:
+            await self._tornado.write_message(data, binary=True)
+
+    async def recv(self):
+        if self._websockets is not None:
+            return await self._websockets.recv()
+        data = await self._tornado.read_message()
+        if data is None:
+            raise ConnectionError("websocket closed")
+        return data
+
+    async def close(self):
+        if self._websockets is not None:
+            await self._websockets.close()
+        else:
+            self._tornado.close()
+
+
+def _has_field(message, name):
+    return name in message.DESCRIPTOR.fields_by_name
+
+
+def widget_state(kind, proto, value):
+    """WidgetState setting widget ``proto`` to ``value``, encoded as this Streamlit version expects.
+
+    Newer versions send options as strings, older ones as indices.
+    """
+    from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+    state = WidgetState(id=proto.id)
+    options = list(getattr(proto, "options", []))
+    if kind == "checkbox":
+        state.bool_value = bool(value)
+    elif kind == "multiselect":
+        if _has_field(proto, "raw_values"):
+            state.string_array_value.data.extend(value)
+        else:
+            state.int_array_value.data.extend(options.index(v) for v in value)
+    elif _has_field(proto, "raw_value"):
+        state.string_value = value
+    else:
+        state.int_value = options.index(value)
+    return state
+
+
+class Session:
+    """One browser tab: a websocket, the widgets of the last run, and the values set so far."""
+
+    def __init__(self, url, page, seed):
+        self.url = url
+        self.page = page
+        self.rng = random.Random(seed)
+        self.page_hash = ""
+        self.pages = {}  # url path and name -> page script hash
+        self.widgets = {}  # key and label -> (kind, proto)
+        self.states = {}  # widget id -> WidgetState
+        self.socket = None
+
+    async def open(self):
+        base = self.url.replace("http", "ws", 1).rstrip("/")
+        for path in ("/_stcore/stream", "/stream"):
+            try:
+                self.socket = await _Socket.connect(base + path)
+                break
+            except Exception:
+                if path == "/stream":
+                    raise
+        # the first run is the main page's; it lists the pages
+        await self.rerun()
+        if self.page not in self.pages:
+            raise LookupError(f"no page {self.page!r}")
+        self.page_hash = self.pages[self.page]
+        return await self.rerun()
+
+    async def rerun(self):
+        """Run the page with the values set so far; (seconds, error message or None)."""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        message = BackMsg()
+        client = message.rerun_script
+        client.page_script_hash = self.page_hash
+        client.page_name = self.page
+        client.widget_states.widgets.extend(self.states.values())
+        start = time.perf_counter()
+        await self.socket.send(message.SerializeToString())
+        widgets, error = {}, None
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(await asyncio.wait_for(self.socket.recv(), TIMEOUT))
+            kind = forward.WhichOneof("type")
+            if kind in ("new_session", "navigation"):
+                for page in getattr(forward, kind).app_pages:
+                    self.pages[page.page_name] = self.pages[page.url_pathname or page.page_name] = \
+                        page.page_script_hash
+                self.page_hash = getattr(forward, kind).page_script_hash or self.page_hash
+            elif kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                element = forward.delta.new_element
+                name = element.WhichOneof("type")
+                if name == "exception":
+                    error = error or element.exception.message
+                elif name in WIDGETS:
+                    proto = getattr(element, name)
+                    widgets[proto.label] = widgets[proto.id.rsplit("-", 1)[-1]] = (name, proto)
+            elif kind == "script_finished":
+                if forward.script_finished == forward.FINISHED_WITH_COMPILE_ERROR:
+                    error = error or "compile error"
+                elif forward.script_finished == forward.FINISHED_EARLY_FOR_RERUN:
+                    continue
+                break
+        self.widgets = widgets
+        return time.perf_counter() - start, error
+
+    def set(self, kind, name, value):
+        if name not in self.widgets or self.widgets[name][0] != kind:
+            raise LookupError(f"no {kind} {name!r} on {self.page}")
+        kind, proto = self.widgets[name]
+        options = list(getattr(proto, "options", []))
+        if value == ANY:
+            value = self.rng.choice(options)
+        elif value == SOME:
+            value = self.rng.sample(options, min(len(options), self.rng.randint(2, 6)))
+        self.states[proto.id] = widget_state(kind, proto, value)
+
+    async def close(self):
+        if self.socket is not None:
+            await self.socket.close()
+
+
+async def run_session(url, script, seed, deadline, think, results):
+    """Drive one session through ``script`` until ``deadline``; appends (script, step, seconds, error)."""
+    page, steps = SCRIPTS[script]
+    session = Session(url, page, seed)
+    try:
+        seconds, error = await session.open()
+        results.append((script, "open", seconds, error))
+        while time.monotonic() < deadline:
+            for kind, name, value in steps:
+                await asyncio.sleep(session.rng.expovariate(1 / think) if think > 0 else 0)
+                if time.monotonic() >= deadline:
+                    break
+                try:
+                    session.set(kind, name, value)
+                except LookupError as e:
+                    results.append((script, name, 0.0, str(e)))
+                    continue
+                seconds, error = await session.rerun()
+                results.append((script, name, seconds, error))
+    except (OSError, ConnectionError, LookupError, asyncio.TimeoutError) as e:
+        results.append((script, "session", 0.0, f"{type(e).__name__}: {e}"))
+    finally:
+        await session.close()
+
+
+def process_tree(pid):
+    """``pid`` and its descendants, from /proc."""
+    pids, queue = [], [pid]
+    while queue:
+        current = queue.pop()
+        pids.append(current)
+        try:
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                queue.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def memory_mb(pids):
+    """(RSS, PSS) in MB summed over ``pids``; PSS counts shared pages once across them."""
+    rss = pss = 0
+    for pid in pids:
+        for path, field, target in ((f"/proc/{pid}/status", "VmRSS:", "rss"),
+                                    (f"/proc/{pid}/smaps_rollup", "Pss:", "pss")):
+            try:
+                with open(path) as f:
+                    for line in f:
+                        if line.startswith(field):
+                            kb = int(line.split()[1])
+                            if target == "rss":
+                                rss += kb
+                            else:
+                                pss += kb
+                            break
+            except OSError:
+                pass
+    return rss / 1024, pss / 1024
+
+
+async def sample_memory(servers, timeline, stop, interval=1.0):
+    start = time.monotonic()
+    while not stop.is_set():
+        pids = [pid for server in servers for pid in process_tree(server.pid)]
+        rss, pss = memory_mb(pids)
+        timeline.append({"t": round(time.monotonic() - start, 2), "rss_mb": round(rss, 1),
+                         "pss_mb": round(pss, 1)})
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+def synthetic_feed():
+    """A vaccinations-by-manufacturer CSV made up from the WHO table: monthly totals per country."""
+    import pandas as pd
+
+    who = datasets.load_vaccinations()[["COUNTRY", "TOTAL_VACCINATIONS"]].dropna()
+    vaccines = ["Pfizer/BioNTech", "Moderna", "Oxford/AstraZeneca", "Johnson&Johnson", "Sinovac"]
+    dates = pd.date_range("2021-01-01", "2022-12-01", freq="MS").strftime("%Y-%m-%d")
+    progress = np.arange(1, len(dates) + 1) / len(dates)
+    rng = np.random.default_rng(0)
+    frames = []
+    for country, total in who.itertuples(index=False):
+        used = rng.choice(vaccines, size=rng.integers(1, 4), replace=False)
+        for vaccine, share in zip(used, rng.dirichlet(np.ones(len(used)))):
+            frames.append(pd.DataFrame({"location": str(country), "date": dates, "vaccine": vaccine,
+                                        "total_vaccinations": (float(total) * share * progress).astype("int64")}))
+    return pd.concat(frames).to_csv(index=False).encode()
+
+
+def serve_feed(body):
+    """Serve ``body`` as the OWID feed from a local HTTP server; returns (server, url)."""
+    etag = '"%x"' % hash(body)
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/csv")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/vaccinations-by-manufacturer.csv"
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(url, process=None, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}")
+        for path in ("/_stcore/health", "/healthz"):
+            try:
+                with urllib.request.urlopen(url + path, timeout=2) as response:
+                    if response.status == 200:
+                        return
+            except OSError:
+                pass
+        time.sleep(0.5)
+    raise TimeoutError(f"{url} not ready after {timeout} s")
+
+
+def start_servers(count, env, log_dir):
+    """``count`` Streamlit servers running Home.py; returns [(process, url)]."""
+    servers = []
+    for i in range(count):
+        port = _free_port()
+        log = open(os.path.join(log_dir, f"server-{i}.log"), "wb")
+        process = subprocess.Popen(
+            [sys.executable, "-m", "streamlit", "run", os.path.join(datasets.ROOT_DIR, "Home.py"),
+             "--server.headless", "true", "--server.port", str(port), "--server.address", "127.0.0.1",
+             "--browser.gatherUsageStats", "false", "--server.fileWatcherType", "none",
+             "--server.enableXsrfProtection", "false"],
+            cwd=datasets.ROOT_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        servers.append((process, f"http://127.0.0.1:{port}"))
+    for process, url in servers:
+        wait_ready(url, process)
+    return servers
+
+
+def summarize(results, elapsed):
+    """One row per script and one for all: reruns, errors and latency percentiles.
+
+    The percentiles are of the interactions; ``open_p50`` is the median time
+    to open the page.
+    """
+    rows = []
+    for script in sorted({r[0] for r in results}) + [None]:
+        chosen = [r for r in results if script is None or r[0] == script]
+        times = [r[2] for r in chosen if r[3] is None and r[1] not in ("open", "session")]
+        opens = [r[2] for r in chosen if r[1] == "open" and r[3] is None]
+        row = {"script": script or "all", "sessions": len(opens), "reruns": len(times),
+               "errors": sum(r[3] is not None for r in chosen),
+               "open_p50": float(np.median(opens)) if opens else float("nan")}
+        for p, value in zip(PERCENTILES, np.percentile(times, PERCENTILES) if times else [float("nan")] * 3):
+            row[f"p{p}"] = float(value)
+        rows.append(row)
+    rows[-1]["throughput"] = rows[-1]["reruns"] / elapsed if elapsed else 0.0
+    return rows
+
+
+async def drive(urls, scripts, sessions, duration, think, ramp, seed, servers):
+    results, timeline = [], []
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_memory(servers, timeline, stop)) if servers else None
+    start = time.monotonic()
+    deadline = start + ramp + duration
+    tasks = []
+    for i in range(sessions):
+        if i and ramp:
+            await asyncio.sleep(ramp / sessions)
+        tasks.append(asyncio.create_task(run_session(urls[i % len(urls)], scripts[i % len(scripts)],
+                                                     seed + i, deadline, think, results)))
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - start
+    stop.set()
+    if sampler is not None:
+        await sampler
+    return results, timeline, elapsed
+
+
+USAGE = """usage: python -m covid.loadtest [--sessions N] [--duration S] [--think S] [--ramp S] [--seed N]
+                               [--servers N | --url URL] [--owid-csv PATH] [--json PATH] [script ...]
+scripts: """ + ", ".join(SCRIPTS)
+
+# option -> type of its value
+OPTIONS = {"sessions": int, "duration": float, "think": float, "ramp": float, "seed": int, "servers": int,
+           "url": str, "owid-csv": str, "json": str}
+
+
+def parse_args(args):
+    """(options, scripts) from the command line; ValueError with the reason when it is not valid."""
+    options, patterns = {}, []
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if not arg.startswith("--"):
+            patterns.append(arg)
+            continue
+        name = arg[2:]
+        if name not in OPTIONS:
+            raise ValueError(f"unknown option {arg}")
+        if not args:
+            raise ValueError(f"{arg} needs a value")
+        value = args.pop(0)
+        try:
+            options[name] = OPTIONS[name](value)
+        except ValueError:
+            raise ValueError(f"{arg} needs a number, not {value!r}") from None
+    scripts = [n for n in SCRIPTS if any(fnmatch.fnmatch(n, p) for p in patterns or ["*"])]
+    if not scripts:
+        raise ValueError(f"no script matches {' '.join(patterns)}")
+    return options, scripts
+
+
+def main(args):
+    try:
+        options, scripts = parse_args(args)
+    except ValueError as e:
+        print(f"{e}\n{USAGE}", file=sys.stderr)
+        return 2
+    sessions = options.get("sessions", 8)
+    duration = options.get("duration", 60.0)
+    think = options.get("think", 1.0)
+    ramp = options.get("ramp", 5.0)
+    seed = options.get("seed", 0)
+
+    feed = process_list = None
+    work = tempfile.mkdtemp(prefix="covid-loadtest-")
+    try:
+        if "url" in options:
+            urls = [options["url"].rstrip("/")]
+            wait_ready(urls[0])
+        else:
+            if "owid-csv" in options:
+                with open(options["owid-csv"], "rb") as f:
+                    body = f.read()
+            else:
+                body = synthetic_feed()
+            feed, feed_url = serve_feed(body)
+            env = dict(os.environ, COVID_OWID_URL=feed_url, COVID_OWID_CACHE_DIR=os.path.join(work, "owid"),
+                       COVID_SWEEP_DIR=os.path.join(work, "sweep"), COVID_OFFLINE="0",
+                       PYTHONPATH=datasets.ROOT_DIR)
+            # the Dashboard's scenario grid, built ahead as python -m covid.etl does
+            subprocess.run([sys.executable, "-m", "covid.sweep"], cwd=datasets.ROOT_DIR, env=env, check=True,
+                           capture_output=True)
+            started = start_servers(options.get("servers", 1), env, work)
+            process_list = [process for process, _ in started]
+            urls = [url for _, url in started]
+        print(f"{sessions} sessions on {len(urls)} server(s) for {duration:g} s: {', '.join(scripts)}")
+        results, timeline, elapsed = asyncio.run(
+            drive(urls, scripts, sessions, duration, think, ramp, seed, process_list or []))
+    finally:
+        for process in process_list or []:
+            process.terminate()
+        for process in process_list or []:
+            process.wait(timeout=30)
+        if feed is not None:
+            feed.shutdown()
+
+    rows = summarize(results, elapsed)
+    print(f"{'script':14} {'open s':>7} {'reruns':>7} {'errors':>7} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7}")
+    for row in rows:
+        print(f"{row['script']:14} {row['open_p50']:7.2f} {row['reruns']:7} {row['errors']:7} "
+              f"{row['p50']:7.3f} {row['p95']:7.3f} {row['p99']:7.3f}")
+    print(f"throughput: {rows[-1]['throughput']:.2f} reruns/s over {elapsed:.0f} s")
+    if timeline:
+        rss = [m["rss_mb"] for m in timeline]
+        pss = [m["pss_mb"] for m in timeline]
+        print(f"server memory MB: RSS start {rss[0]:.0f} peak {max(rss):.0f} end {rss[-1]:.0f}; "
+              f"PSS start {pss[0]:.0f} peak {max(pss):.0f} end {pss[-1]:.0f}")
+    errors = sorted({r[3] for r in results if r[3] is not None})
+    for error in errors[:5]:
+        print(f"error: {error[:200]}")
+    if errors and "url" not in options:
+        print(f"server logs in {work}")
+    else:
+        shutil.rmtree(work, ignore_errors=True)
+    if "json" in options:
+        report = {"sessions": sessions, "servers": len(urls), "duration": duration, "think": think,
+                  "scripts": scripts, "elapsed": elapsed, "summary": rows, "memory": timeline,
+                  "errors": errors}
+        with open(options["json"], "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
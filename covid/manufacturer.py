@@ -0,0 +1,105 @@
+"""Per-country views of the OWID vaccinations-by-manufacturer data.
+
+The feed is stored sorted by location in an Arrow IPC file with an offset
+index, so the Dashboard memory-maps it once per process and slices out the
+selected country instead of filtering the whole frame on every rerun.
+"""
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+OFFSETS_KEY = b"covid:offsets"
+SOURCE_DIGEST_KEY = b"covid:source_sha1"
+
+_lock = threading.Lock()
+_opened = {}  # path -> (mtime_ns, size, table, offsets, digest)
+
+
+def panel(df_country):
+    """Dense date x vaccine table of cumulative doses for one country, in long form.
+
+    Every (date, vaccine) pair gets a row, dates ascending and vaccines
+    sorted within each date. A vaccine with no report (or a 0) on a date
+    carries its previous value forward; before its first report it is 0.
+    Columns: location, date, vaccine, total_vaccinations.
+    """
+    dates = np.sort(df_country["date"].unique())
+    vaccines = np.sort(df_country["vaccine"].unique())
+    wide = df_country.pivot_table(index="date", columns="vaccine", values="total_vaccinations",
+                                  aggfunc="first").reindex(index=dates, columns=vaccines)
+    wide = wide.mask(wide == 0).ffill().fillna(0)
+
+    location = df_country["location"].iloc[0] if len(df_country) else None
+    return pd.DataFrame({
+        "location": location,
+        "date": np.repeat(dates, len(vaccines)),
+        "vaccine": np.tile(vaccines, len(dates)),
+        "total_vaccinations": wide.to_numpy(dtype=float).ravel(),
+    })
+
+
+def write_partitions(frame, path, digest, key="location"):
+    """Write ``frame`` as an uncompressed Arrow IPC file sorted by ``key``.
+
+    The schema metadata holds ``{key value: [first row, row count]}`` so a
+    single partition can be sliced out of the memory-mapped file without
+    scanning it, plus the digest of the source the file was built from.
+    """
+    import pyarrow as pa
+
+    frame = frame.dropna(subset=[key]).sort_values(key, kind="stable").reset_index(drop=True)
+    keys, starts, counts = np.unique(frame[key].to_numpy(dtype=str), return_index=True,
+                                     return_counts=True)
+    offsets = {k: [int(s), int(c)] for k, s, c in zip(keys, starts, counts)}
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                           OFFSETS_KEY: json.dumps(offsets).encode(),
+                                           SOURCE_DIGEST_KEY: digest.encode()})
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, path)
+
+
+def open_partitions(path):
+    """(memory-mapped table, offsets, source digest) for a file from ``write_partitions``.
+
+    The mapping is opened once per file version and shared by every caller.
+    """
+    import pyarrow as pa
+
+    st = os.stat(path)
+    with _lock:
+        known = _opened.get(path)
+        if known is not None and known[:2] == (st.st_mtime_ns, st.st_size):
+            return known[2:]
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        metadata = table.schema.metadata
+        offsets = json.loads(metadata[OFFSETS_KEY])
+        digest = metadata[SOURCE_DIGEST_KEY].decode()
+        _opened[path] = (st.st_mtime_ns, st.st_size, table, offsets, digest)
+        return table, offsets, digest
+
+
+def partition_digest(path):
+    """Digest of the source ``path`` was built from, or None if there is no such file."""
+    try:
+        return open_partitions(path)[2]
+    except FileNotFoundError:
+        return None
+
+
+def partition_keys(path):
+    """Sorted key values (e.g. locations) present in the partitioned file."""
+    return sorted(open_partitions(path)[1])
+
+
+def read_partition(path, value):
+    """Rows whose key equals ``value``, read from the mapped file only for that slice."""
+    table, offsets, _ = open_partitions(path)
+    start, count = offsets.get(value, (0, 0))
+    return table.slice(start, count).to_pandas()
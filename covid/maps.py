@@ -0,0 +1,213 @@
+"""Interactive (folium) map building with level-of-detail geometry.
+
+``GeoDataFrame.explore`` embeds every vertex of every polygon in the page,
+even when the map is shown zoomed out to the whole world. ``explore`` below
+swaps in a simplified copy of the geometry whose tolerance is about one
+screen pixel at the requested zoom. The simplified tiers are computed once
+per geometry set and reused.
+
+``explore_html`` goes one step further and caches the rendered page, keyed
+by the content of the frame and every styling argument, so flipping a
+selectbox back to a map already shown serves the stored HTML instead of
+rebuilding the GeoJSON and the folium tree. The cache is an in-memory LRU
+bounded by ``COVID_MAP_CACHE_MB``; with ``COVID_MAP_CACHE_DIR`` set, pages
+are also kept on disk and shared between processes and restarts.
+
+    python -m covid.maps     # bytes and build time per tier for the world map
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from covid import timing
+
+# simplification tolerance in degrees; 0 keeps the original geometry
+TOLERANCES = (0.5, 0.25, 0.1, 0.0)
+TILE_SIZE = 256
+MAX_GEOMETRY_SETS = 16
+HTML_BUDGET_MB = float(os.environ.get("COVID_MAP_CACHE_MB", 64))
+
+_lock = threading.Lock()
+_tiers = OrderedDict()  # geometry digest -> {tolerance: GeoSeries}
+_html = OrderedDict()  # content key -> rendered map page
+stats = []  # one dict per map built: tolerance, seconds, bytes, cache
+
+
+def geometry_digest(frame):
+    sha = hashlib.sha1()
+    for wkb in frame.geometry.to_wkb():
+        sha.update(wkb or b"")
+    return sha.hexdigest()
+
+
+def tolerance_for_zoom(zoom):
+    """Largest tier tolerance not coarser than one pixel at ``zoom``."""
+    pixel = 360 / (TILE_SIZE * 2 ** zoom)
+    return max(t for t in TOLERANCES if t <= pixel)
+
+
+def lod_tiers(frame):
+    """{tolerance: simplified geometry} for every tier, cached per geometry set."""
+    digest = geometry_digest(frame)
+    with _lock:
+        if digest in _tiers:
+            _tiers.move_to_end(digest)
+            return _tiers[digest]
+    tiers = {t: frame.geometry.simplify(t, preserve_topology=True) if t else frame.geometry
+             for t in TOLERANCES}
+    with _lock:
+        _tiers[digest] = tiers
+        while len(_tiers) > MAX_GEOMETRY_SETS:
+            _tiers.popitem(last=False)
+    return tiers
+
+
+def simplified(frame, zoom):
+    """Copy of ``frame`` with the geometry tier suited to ``zoom``."""
+    tolerance = tolerance_for_zoom(zoom)
+    if not tolerance:
+        return frame, tolerance
+    return frame.set_geometry(lod_tiers(frame)[tolerance]), tolerance
+
+
+def explore(frame, zoom=2, **kwargs):
+    """``frame.explore(**kwargs)`` on geometry simplified for ``zoom``.
+
+    Build time is appended to ``stats``; with ``COVID_MAP_STATS=1`` the size
+    of the rendered HTML is measured too.
+    """
+    start = time.perf_counter()
+    frame, tolerance = simplified(frame, zoom)
+    m = frame.explore(zoom_start=zoom, **kwargs)
+    record = {"column": kwargs.get("column"), "tolerance": tolerance,
+              "seconds": time.perf_counter() - start}
+    if os.environ.get("COVID_MAP_STATS", "") not in ("", "0"):
+        record["bytes"] = len(m.get_root().render())
+    _record(record)
+    return m
+
+
+def _record(record):
+    stats.append(record)
+    del stats[:-100]
+
+
+def frame_digest(frame):
+    """Digest of the geometry and every attribute value (with the index) of ``frame``."""
+    import pandas as pd
+
+    sha = hashlib.sha1(geometry_digest(frame).encode())
+    attributes = frame.drop(columns=frame.geometry.name)
+    sha.update(json.dumps([str(c) for c in attributes.columns]).encode())
+    sha.update(pd.util.hash_pandas_object(attributes.astype(object), index=True).to_numpy().tobytes())
+    return sha.hexdigest()
+
+
+def html_key(frame, zoom, **kwargs):
+    """Cache key of a map: frame content, zoom tier, column, cmap, tiles, popup, tooltip..."""
+    options = json.dumps({"tolerance": tolerance_for_zoom(zoom), "zoom": zoom, **kwargs},
+                         sort_keys=True, default=repr)
+    return hashlib.sha1(f"{frame_digest(frame)}:{options}".encode()).hexdigest()
+
+
+def cache_dir():
+    return os.environ.get("COVID_MAP_CACHE_DIR") or None
+
+
+def _remember(key, html):
+    with _lock:
+        _html[key] = html
+        _html.move_to_end(key)
+        budget = HTML_BUDGET_MB * 2 ** 20
+        while len(_html) > 1 and sum(len(h) for h in _html.values()) > budget:
+            _html.popitem(last=False)
+
+
+def _disk_path(key):
+    directory = cache_dir()
+    return os.path.join(directory, key + ".html") if directory else None
+
+
+def _read_disk(key):
+    path = _disk_path(key)
+    if path is None:
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _write_disk(key, html):
+    path = _disk_path(key)
+    if path is None:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(html)
+    os.replace(tmp, path)
+
+
+@timing.timed("folium map html")
+def explore_html(frame, zoom=2, **kwargs):
+    """Standalone HTML page of ``explore(frame, zoom, **kwargs)``, served from cache when possible.
+
+    Show it with ``streamlit.components.v1.html``.
+    """
+    start = time.perf_counter()
+    key = html_key(frame, zoom, **kwargs)
+    with _lock:
+        html = _html.get(key)
+        if html is not None:
+            _html.move_to_end(key)
+    source = "memory"
+    if html is None:
+        html = _read_disk(key)
+        source = "disk"
+        if html is None:
+            html = explore(frame, zoom, **kwargs).get_root().render()
+            _write_disk(key, html)
+            source = None
+        _remember(key, html)
+    if source:
+        _record({"column": kwargs.get("column"), "tolerance": tolerance_for_zoom(zoom),
+                 "seconds": time.perf_counter() - start, "bytes": len(html), "cache": source})
+    return html
+
+
+def html_cache_info():
+    """Entries and bytes held by the in-memory HTML cache."""
+    with _lock:
+        return {"entries": len(_html), "bytes": sum(len(h) for h in _html.values())}
+
+
+def clear_html_cache():
+    with _lock:
+        _html.clear()
+
+
+def report(frame, **kwargs):
+    """Bytes and build time of the map for each tier, as a DataFrame."""
+    import pandas as pd
+
+    tiers = lod_tiers(frame)
+    frame.explore(**kwargs).get_root().render()  # warm up imports and templates
+    rows = []
+    for tolerance in TOLERANCES:
+        start = time.perf_counter()
+        tiered = frame.set_geometry(tiers[tolerance]) if tolerance else frame
+        html = tiered.explore(**kwargs).get_root().render()
+        rows.append({"tolerance": tolerance, "bytes": len(html),
+                     "seconds": time.perf_counter() - start})
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    from covid import datasets
+    world = datasets.load_infection()
+    print(report(world, column="Omicron Infection", tooltip="name"))
@@ -0,0 +1,191 @@
+"""Local read-through cache for the OWID vaccinations-by-manufacturer feed.
+
+The Dashboard used to ``pd.read_csv`` the GitHub URL on every rerun. The feed
+is now kept as a snapshot under ``data/cache/`` and only re-requested once
+the snapshot is older than ``COVID_OWID_TTL`` seconds; the request is
+conditional (ETag / Last-Modified) so an unchanged feed is not downloaded
+again. Once a snapshot exists, that request runs in a background thread and
+the rerun that finds the snapshot stale is served the snapshot right away, so
+rerun latency does not depend on the network. A failed request is not retried
+for ``COVID_OWID_RETRY`` seconds. With ``COVID_OFFLINE=1``, or when the
+request fails, the last snapshot is served as is.
+
+``COVID_OWID_URL`` points the cache at another source, e.g. a local file
+server or a ``file://`` URL, and ``COVID_OWID_CACHE_DIR`` keeps its
+snapshot somewhere other than ``data/cache``.
+"""
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pandas as pd
+
+from covid import datasets, manufacturer, schema, timing
+
+OWID_URL = "https://raw.githubusercontent.com/owid/covid-19-data/master/public/data/vaccinations/vaccinations-by-manufacturer.csv"
+CACHE_DIR = os.environ.get("COVID_OWID_CACHE_DIR", os.path.join(datasets.DATA_DIR, "cache"))
+SNAPSHOT = os.path.join(CACHE_DIR, "vaccinations-by-manufacturer.csv")
+SNAPSHOT_META = SNAPSHOT + ".json"
+PARTITIONS = os.path.join(CACHE_DIR, "vaccinations-by-manufacturer.arrow")
+
+TTL = float(os.environ.get("COVID_OWID_TTL", 6 * 3600))
+RETRY = float(os.environ.get("COVID_OWID_RETRY", 600))
+TIMEOUT = 30
+
+_lock = threading.Lock()  # snapshot, its metadata and the partitioned copy
+_fetch_lock = threading.Lock()  # one request to the feed at a time
+_revalidation = None  # background thread of the current revalidation
+
+
+def source_url():
+    return os.environ.get("COVID_OWID_URL", OWID_URL)
+
+
+def offline():
+    return os.environ.get("COVID_OFFLINE", "") not in ("", "0")
+
+
+def read_meta():
+    try:
+        with open(SNAPSHOT_META) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _write_atomic(path, data, mode="wb"):
+    tmp = path + ".tmp"
+    with open(tmp, mode) as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _write_meta(meta):
+    _write_atomic(SNAPSHOT_META, json.dumps(meta), mode="w")
+
+
+def is_stale(meta, url, ttl):
+    return (not os.path.exists(SNAPSHOT) or meta.get("url") != url
+            or time.time() - meta.get("checked_at", 0) > ttl)
+
+
+def backing_off(meta, url):
+    """True while a failed request for ``url`` is younger than ``RETRY``."""
+    return meta.get("failed_url") == url and time.time() - meta.get("failed_at", 0) < RETRY
+
+
+def refresh(url=None, ttl=None, force=False, wait=False):
+    """Bring the snapshot up to date with ``url`` if it is older than ``ttl``.
+
+    When a snapshot of ``url`` exists, the request runs in a background
+    thread and "revalidating" is returned at once; ``wait`` or ``force``
+    make the request before returning. Otherwise returns "fresh" (within
+    ttl), "backing-off" (a request failed less than ``RETRY`` seconds ago),
+    "not-modified", "downloaded", "offline" or "failed". Raises only when
+    there is no snapshot to fall back on.
+    """
+    global _revalidation
+    url = url or source_url()
+    ttl = TTL if ttl is None else ttl
+    with _lock:
+        meta = read_meta()
+        if not force and not is_stale(meta, url, ttl):
+            return "fresh"
+        if offline():
+            if not os.path.exists(SNAPSHOT):
+                raise FileNotFoundError(f"offline and no snapshot at {SNAPSHOT}")
+            return "offline"
+        if not force and os.path.exists(SNAPSHOT) and backing_off(meta, url):
+            return "backing-off"
+        if meta.get("url") == url and os.path.exists(SNAPSHOT) and not (force or wait):
+            if _revalidation is None or not _revalidation.is_alive():
+                _revalidation = threading.Thread(target=_check, args=(url, ttl), daemon=True,
+                                                 name="owid-revalidation")
+                _revalidation.start()
+            return "revalidating"
+    return _check(url, ttl, force)
+
+
+def _check(url, ttl, force=False):
+    """Request ``url``, conditionally when a snapshot of it exists, and store the answer."""
+    with _fetch_lock:
+        with _lock:
+            meta = read_meta()
+            if not force and not is_stale(meta, url, ttl):
+                return "fresh"
+        request = urllib.request.Request(url)
+        if meta.get("url") == url and os.path.exists(SNAPSHOT):
+            if meta.get("etag"):
+                request.add_header("If-None-Match", meta["etag"])
+            if meta.get("last_modified"):
+                request.add_header("If-Modified-Since", meta["last_modified"])
+        try:
+            with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+                body = response.read()
+                headers = response.headers
+        except urllib.error.HTTPError as e:
+            if e.code != 304:
+                return _fall_back(meta, url, e)
+            meta["checked_at"] = time.time()
+            meta.pop("failed_at", None)
+            meta.pop("failed_url", None)
+            with _lock:
+                _write_meta(meta)
+            return "not-modified"
+        except (urllib.error.URLError, OSError) as e:
+            return _fall_back(meta, url, e)
+
+        with _lock:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            _write_atomic(SNAPSHOT, body)
+            _write_meta({"url": url, "checked_at": time.time(),
+                         "etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified")})
+        return "downloaded"
+
+
+def _fall_back(meta, url, error):
+    if not os.path.exists(SNAPSHOT):
+        raise error
+    meta.update(failed_at=time.time(), failed_url=url)
+    with _lock:
+        _write_meta(meta)
+    return "failed"
+
+
+def load_manufacturer(url=None, ttl=None):
+    """The vaccinations-by-manufacturer frame, refreshed at most once per ``ttl``.
+
+    Parsed once per snapshot version via ``datasets.load_source``; treat it as
+    read-only.
+    """
+    refresh(url, ttl)
+    return datasets.load_source(SNAPSHOT, pd.read_csv, "owid_manufacturer")
+
+
+def partitions(url=None, ttl=None):
+    """Path of the per-location partitioned copy of the snapshot, rebuilt when the snapshot changes."""
+    refresh(url, ttl)
+    digest = datasets.file_digest(SNAPSHOT)
+    with _lock:
+        if manufacturer.partition_digest(PARTITIONS) != digest:
+            manufacturer.write_partitions(schema.compact(pd.read_csv(SNAPSHOT), "owid_manufacturer"),
+                                         PARTITIONS, digest)
+    return PARTITIONS
+
+
+def load_locations(url=None, ttl=None):
+    """Every location in the feed, sorted."""
+    return manufacturer.partition_keys(partitions(url, ttl))
+
+
+@timing.timed("load OWID country")
+def load_country(location, url=None, ttl=None):
+    """Rows of the feed for one location, without loading the rest of it."""
+    return manufacturer.read_partition(partitions(url, ttl), location)
+
+
+if __name__ == "__main__":
+    print(refresh(force=True))
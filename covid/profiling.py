@@ -0,0 +1,164 @@
+"""On-demand profiles of whole page runs.
+
+    COVID_PROFILE=cprofile streamlit run Home.py   # every run of every page
+    http://localhost:8501/Dashboard?profile=sample # runs of one session
+    COVID_PROFILE=cprofile python -m covid.bench dashboard
+
+``timing.begin`` and ``timing.report`` bracket each page run; when profiling
+is armed they start and stop a profiler around it, and the run leaves one
+artifact in ``COVID_PROFILE_DIR`` (default ``data/cache/profiles``), named
+after the page and the values of its keyed widgets, e.g.
+``Dashboard--dashboard_country=Germany.prof``. A later run with the same
+state overwrites it.
+
+* ``cprofile`` (or ``1``): deterministic, writes ``.prof`` pstats files
+  (``python -m pstats``, snakeviz, flameprof);
+* ``sample``: samples the script thread's stack every
+  ``COVID_PROFILE_INTERVAL`` seconds and writes ``.folded`` stacks, one
+  "frame;frame;... count" line per stack (flamegraph.pl, speedscope).
+
+cProfile adds overhead to every call, so its absolute times run high; the
+sampler's does not, but it misses short calls.
+"""
+import cProfile
+import collections
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+
+from covid import timing
+
+PROFILE_DIR = os.environ.get("COVID_PROFILE_DIR", os.path.join(timing.ROOT_DIR, "data", "cache", "profiles"))
+INTERVAL = float(os.environ.get("COVID_PROFILE_INTERVAL", 0.005))
+MAX_NAME = 120
+MODES = {"1": "cprofile", "cprofile": "cprofile", "sample": "sample"}
+
+# one run is profiled at a time (cProfile allows only one profiler on Python
+# 3.12+): (thread, profiler) of that run, or None
+_active = None
+_lock = threading.Lock()
+_SAFE = re.compile(r"[^A-Za-z0-9._=+-]+")
+
+
+def requested_mode():
+    """'cprofile', 'sample' or None, from COVID_PROFILE or the ``profile`` query parameter."""
+    value = os.environ.get("COVID_PROFILE", "")
+    if value in ("", "0"):
+        value = timing.query_param("profile") or ""
+    return MODES.get(value)
+
+
+class Sampler:
+    """Folded stacks of one thread, sampled from a background thread."""
+
+    def __init__(self, thread_id, interval=INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def dump(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _halt(profiler):
+    if isinstance(profiler, Sampler):
+        profiler.stop()
+    else:
+        profiler.disable()
+
+
+def start():
+    """Start profiling this run if armed; returns the profiler or None.
+
+    Runs that start while another session's run is being profiled are not
+    profiled. A run that never reached ``stop`` (a rerun interrupted it)
+    gives up its profiler here, without an artifact.
+    """
+    global _active
+    mode = requested_mode()
+    if mode is None:
+        return None
+    with _lock:
+        if _active is not None:
+            thread, stale = _active
+            if thread.is_alive() and thread is not threading.current_thread():
+                return None
+            _halt(stale)
+            _active = None
+        if mode == "sample":
+            profiler = Sampler(threading.get_ident())
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        _active = (threading.current_thread(), profiler)
+    return profiler
+
+
+def widget_state():
+    """{key: value} of the session's keyed widgets with plain values."""
+    import streamlit as st
+
+    plain = (str, bool, int, float)
+    state = {}
+    for key, value in st.session_state.items():
+        if not isinstance(key, str) or key.startswith("covid_"):
+            continue
+        if isinstance(value, plain) or (isinstance(value, (list, tuple))
+                                        and all(isinstance(v, plain) for v in value)):
+            state[key] = value
+    return dict(sorted(state.items()))
+
+
+def artifact_name(page, state):
+    """File name stem for a profile of ``page`` with widget ``state``."""
+    parts = [page] + [f"{k}={'+'.join(map(str, v)) if isinstance(v, (list, tuple)) else v}"
+                      for k, v in state.items()]
+    name = _SAFE.sub("_", "--".join(parts))
+    if len(name) > MAX_NAME:
+        digest = hashlib.sha1(json.dumps(state, sort_keys=True).encode()).hexdigest()[:8]
+        name = f"{name[:MAX_NAME]}--{digest}"
+    return name
+
+
+def stop(profiler, page):
+    """Stop ``profiler`` and write its artifact; returns the path."""
+    global _active
+    with _lock:
+        _halt(profiler)
+        if _active is not None and _active[1] is profiler:
+            _active = None
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stem = os.path.join(PROFILE_DIR, artifact_name(page, widget_state()))
+    if isinstance(profiler, Sampler):
+        path = stem + ".folded"
+        profiler.dump(path)
+    else:
+        path = stem + ".prof"
+        profiler.dump_stats(path)
+    return path
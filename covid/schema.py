@@ -0,0 +1,174 @@
+"""Compact column dtypes for the frames the pages keep in memory.
+
+Every session shares the frames in ``covid.datasets``' cache, but each
+still holds them as parsed: repeated strings (continents, regions, vaccine
+lists, OWID locations) as one Python object per row and every number as
+float64. ``compact`` applies a per-dataset policy once, at load time:
+
+* ``CATEGORY``: repeated strings as categoricals;
+* ``COUNT``: whole numbers in the smallest integer type that holds them,
+  nullable (``UInt32`` etc.) only when values are missing;
+* ``FLOAT32``: percentages and rates, only in frames no derived file is
+  written from (``covid.etl`` reads the WHO and country efficacy tables,
+  so their floats stay float64 and the files it writes stay exact);
+* ``DATE``: ISO date strings as datetime64.
+
+A column that does not fit its policy (a "count" with fractions, a date
+that does not parse) is left as it is. ``COVID_COMPACT_DTYPES=0`` turns the
+policy off.
+
+    python -m covid.schema     # memory per dataset, as parsed and compacted
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+CATEGORY = "category"
+COUNT = "count"
+FLOAT32 = "float32"
+DATE = "date"
+
+_VARIANTS = ("Alpha", "Delta", "Omicron")
+_RATES = [f"{v} {what}" for v in _VARIANTS
+          for what in ("Infection Efficacy", "Breakthrough Infection", "Protection", "Infection")]
+
+# dataset name (the ``policy`` argument of ``datasets.load_source``) -> {column: kind}
+POLICIES = {
+    "who_vaccinations": {
+        "WHO_REGION": CATEGORY, "DATA_SOURCE": CATEGORY, "VACCINES_USED": CATEGORY,
+        "TOTAL_VACCINATIONS": COUNT, "PERSONS_VACCINATED_1PLUS_DOSE": COUNT,
+        "PERSONS_FULLY_VACCINATED": COUNT, "PERSONS_BOOSTER_ADD_DOSE": COUNT,
+        "NUMBER_VACCINES_TYPES_USED": COUNT,
+    },
+    "naturalearth": {
+        "continent": CATEGORY, "pop_est": COUNT, "gdp_md_est": COUNT,
+    },
+    "world_dataset": {
+        "continent": CATEGORY, "vaccines": CATEGORY,
+        "pop_est": COUNT, "gdp_md_est": COUNT, "Total_Vaccinations": COUNT,
+        "Persons_Fully_Vaccinated": COUNT, "persons_vaccinated": COUNT,
+        "gdp_per_cap": FLOAT32, "Total_Vaccinations_Per100": FLOAT32,
+        "Persons_Fully_Vaccinated_Per100": FLOAT32, "persons_vaccinated_per100": FLOAT32,
+        "% People Fully Vaccinated": FLOAT32, "% People Vaccinated": FLOAT32,
+    },
+    # written by covid.etl with these dtypes; the shares stay float64 because
+    # the infection file is computed from them
+    "world_coverage": {
+        "continent": CATEGORY,
+        "pop_est": COUNT, "gdp_md_est": COUNT,
+        "Persons_Fully_Vaccinated": COUNT, "persons_vaccinated": COUNT,
+    },
+    "infection": {
+        "continent": CATEGORY,
+        "pop_est": COUNT, "gdp_md_est": COUNT,
+        "Persons_Fully_Vaccinated": COUNT, "persons_vaccinated": COUNT,
+        "gdp_per_cap": FLOAT32, "% People Fully Vaccinated": FLOAT32, "% People Vaccinated": FLOAT32,
+        **{column: FLOAT32 for column in _RATES},
+    },
+    "owid_manufacturer": {
+        "location": CATEGORY, "vaccine": CATEGORY, "date": DATE, "total_vaccinations": COUNT,
+    },
+}
+
+_UNSIGNED = [np.uint8, np.uint16, np.uint32, np.uint64]
+_SIGNED = [np.int8, np.int16, np.int32, np.int64]
+
+
+def enabled():
+    return os.environ.get("COVID_COMPACT_DTYPES", "1") not in ("", "0")
+
+
+def count_dtype(values):
+    """Smallest integer dtype holding ``values``, nullable if any is missing; None if not whole."""
+    present = values.dropna()
+    if not pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+        return None
+    if len(present) and not np.array_equal(present, np.floor(present)):
+        return None
+    low, high = (present.min(), present.max()) if len(present) else (0, 0)
+    for dtype in (_UNSIGNED if low >= 0 else _SIGNED):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            break
+    name = np.dtype(dtype).name
+    return name.replace("uint", "UInt").replace("int", "Int") if len(present) < len(values) else name
+
+
+def _compact_column(values, kind):
+    if kind == CATEGORY:
+        return values if isinstance(values.dtype, pd.CategoricalDtype) else values.astype("category")
+    if kind == COUNT:
+        dtype = count_dtype(values)
+        return values if dtype is None else values.astype(dtype)
+    if kind == FLOAT32:
+        return values.astype(np.float32) if pd.api.types.is_float_dtype(values) else values
+    if kind == DATE:
+        if pd.api.types.is_datetime64_any_dtype(values):
+            return values
+        try:
+            return pd.to_datetime(values, format="%Y-%m-%d")
+        except (TypeError, ValueError):
+            return values
+    raise ValueError(f"unknown dtype policy {kind!r}")
+
+
+def compact(frame, policy):
+    """``frame`` with the dtypes of dataset ``policy`` (a key of ``POLICIES``) applied.
+
+    Returns ``frame`` itself when there is nothing to change.
+    """
+    if policy is None or not enabled():
+        return frame
+    changed = {}
+    for column, kind in POLICIES[policy].items():
+        if column in frame.columns:
+            values = _compact_column(frame[column], kind)
+            if values is not frame[column]:
+                changed[column] = values
+    if not changed:
+        return frame
+    frame = frame.copy()
+    for column, values in changed.items():
+        frame[column] = values
+    return frame
+
+
+def geometry_nbytes(frame):
+    """Bytes of the frame's geometry as WKB; ``memory_usage`` only counts the pointers."""
+    geometry = getattr(frame, "geometry", None) if hasattr(frame, "_geometry_column_name") else None
+    if geometry is None:
+        return 0
+    return int(sum(len(g) for g in geometry.to_wkb() if g is not None))
+
+
+def memory_report(frames):
+    """One row per ``{name: (as parsed, compacted)}`` entry with its memory in MB."""
+    rows = []
+    for name, (raw, compacted) in frames.items():
+        before = int(raw.memory_usage(deep=True).sum())
+        after = int(compacted.memory_usage(deep=True).sum())
+        rows.append({"dataset": name, "rows": len(raw), "parsed MB": before / 1e6,
+                     "compact MB": after / 1e6, "saved %": 100 * (1 - after / before) if before else 0.0,
+                     "geometry MB": geometry_nbytes(raw) / 1e6})
+    return pd.DataFrame(rows, columns=["dataset", "rows", "parsed MB", "compact MB", "saved %",
+                                       "geometry MB"])
+
+
+def _parsed_datasets():
+    from covid import datasets, owid
+
+    sources = {"who_vaccinations": (datasets.WHO_VACCINATION_XLSX, pd.read_excel),
+               "naturalearth": (datasets.naturalearth_path(), datasets._read_geo),
+               "world_dataset": (datasets.WORLD_DATASET_CSV, datasets.read_wkt_csv),
+               "infection": (datasets.INFECTION_SHP, datasets._read_geo),
+               "owid_manufacturer": (owid.SNAPSHOT, pd.read_csv)}
+    for name, (path, reader) in sources.items():
+        if os.path.exists(path):
+            raw = reader(path)
+            yield name, (raw, compact(raw, name))
+
+
+if __name__ == "__main__":
+    with pd.option_context("display.width", 120, "display.float_format", "{:.3f}".format):
+        print(memory_report(dict(_parsed_datasets())).to_string(index=False))
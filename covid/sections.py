@@ -0,0 +1,34 @@
+"""Lazily evaluated page sections.
+
+``st.tabs`` sends every tab to the browser, so Streamlit runs every tab's
+body on each rerun, whichever tab is on screen. ``tabs`` draws the tab bar
+as a widget instead: its value is the open tab, and a page guards each
+body with ``if tab == ...:`` so only that one runs. Results a section needs
+again on later reruns go through ``session_cached``, which keeps them in
+the session state until the data they came from changes; results that are
+the same for every session go through ``datasets.derived`` instead.
+"""
+import streamlit as st
+
+_STATE_KEY = "covid_sections"
+
+
+def tabs(labels, key):
+    """Label of the open tab of a tab bar showing ``labels``; the first one initially."""
+    return st.radio(key, labels, horizontal=True, key=key, label_visibility="collapsed")
+
+
+def session_cached(name, build, *deps):
+    """``build()``, reused on this session's reruns while ``deps`` are unchanged.
+
+    ``deps`` should identify the inputs, e.g. ``datasets.source_digest``
+    of the files ``build`` reads. Treat the value as read-only, unless it
+    is per-session state meant to change, like a ``whatif.Scenario``.
+    """
+    store = st.session_state.setdefault(_STATE_KEY, {})
+    known = store.get(name)
+    if known is not None and known[0] == deps:
+        return known[1]
+    value = build()
+    store[name] = (deps, value)
+    return value
@@ -0,0 +1,230 @@
+"""Frames shared between server processes through memory-mapped Arrow files.
+
+``covid.datasets`` parses each file once per process, and the frames the
+pages derive from them are kept once per process as well. A deployment
+that runs several Streamlit processes still holds one copy per process.
+With ``COVID_SHARED_DATA=1``, the first process to parse a dataset
+publishes it as an uncompressed Arrow IPC file in ``COVID_SHARED_DIR``
+(default ``/dev/shm/covid-data``, else ``data/cache/shared``). Every
+process, including the publisher, then uses a frame memory-mapped from that
+file. The pages of the mapping are the operating system's page cache,
+shared by every process that maps the file, so they count once however
+many processes and sessions read them.
+
+Columns whose Arrow layout is also pandas' layout are zero-copy, read-only
+views of the mapping: numbers without missing values, and the codes of
+categoricals. Text, nullable numbers with gaps and geometries are still
+materialised per process. Frames Arrow cannot hold, such as the raw
+efficacy sheet with its mixed header row, stay private to the process.
+
+A file is named after the dataset and the digest of its source, so a
+changed source is published under a new name. Older versions are removed
+once the new one is in place; processes still mapping them keep them until
+they let go.
+
+The frames are small next to an interpreter with pandas, geopandas and
+Streamlit loaded; most of what a process saves is the parsing, and the
+parser modules it would import. The publisher pays for both and then maps
+the file too, so sharing helps only with several processes. ``--processes``
+measures it: it starts N processes that load every dataset, with sharing
+off and on, and reports their summed RSS and PSS (Linux ``/proc``). The
+PSS above that of N processes that load nothing is the data's cost.
+
+    python -m covid.shared                  # publish every dataset, report how much is shared
+    python -m covid.shared --processes 4    # memory of 4 processes, sharing off and on
+"""
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+
+import numpy as np
+
+from covid import storage, timing
+
+SHARED_DIR = os.environ.get("COVID_SHARED_DIR") or (
+    "/dev/shm/covid-data" if os.path.isdir("/dev/shm")
+    else os.path.join(timing.ROOT_DIR, "data", "cache", "shared"))
+
+_lock = threading.Lock()
+
+
+def enabled():
+    if os.environ.get("COVID_SHARED_DATA", "") in ("", "0"):
+        return False
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def file_name(name, version):
+    """``<name digest>-<version digest>.arrow``: one name per dataset, one version per source digest."""
+    stem = hashlib.sha1(name.encode()).hexdigest()[:16]
+    return f"{stem}-{hashlib.sha1(version.encode()).hexdigest()[:16]}.arrow"
+
+
+def publish(frame, path):
+    """Write ``frame`` to ``path`` atomically; False when Arrow cannot hold it."""
+    import pyarrow as pa
+
+    try:
+        table = storage.to_arrow(frame)
+    except (pa.ArrowException, AttributeError, TypeError, ValueError):
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with pa.OSFile(tmp, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)
+    return True
+
+
+def attach(path):
+    """The frame published at ``path``, backed by a read-only mapping of the file."""
+    import pyarrow as pa
+
+    with pa.memory_map(path, "r") as source:
+        return storage.from_arrow(pa.ipc.open_file(source).read_all(), split_blocks=True, self_destruct=False)
+
+
+def _remove_older(path):
+    stem = os.path.basename(path).split("-")[0]
+    for name in os.listdir(os.path.dirname(path)):
+        if name.startswith(stem + "-") and name.endswith(".arrow") and name != os.path.basename(path):
+            try:
+                os.remove(os.path.join(os.path.dirname(path), name))
+            except FileNotFoundError:
+                pass
+
+
+def frame(name, version, build):
+    """The shared frame of dataset ``name`` at ``version``, publishing ``build()`` if nobody has.
+
+    ``name`` and ``version`` must be the same in every process, e.g. a
+    path and reader, and the source digest. Returns ``build()`` itself when
+    it cannot be published.
+    """
+    path = os.path.join(SHARED_DIR, file_name(name, version))
+    if os.path.exists(path):
+        return attach(path)
+    built = build()
+    with _lock:
+        if not os.path.exists(path):
+            if not publish(built, path):
+                return built
+            _remove_older(path)
+    return attach(path)
+
+
+def zero_copy_share(frame):
+    """Fraction of the frame's bytes that are read-only views of a mapping.
+
+    Geometries count as their WKB size, and are never shared.
+    """
+    import pandas as pd
+
+    from covid import schema
+
+    shared = 0
+    total = schema.geometry_nbytes(frame)
+    for column in frame.columns:
+        values = frame[column]
+        nbytes = int(values.memory_usage(deep=True, index=False))
+        total += nbytes
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            array = values.array.codes
+        elif values.dtype == object:
+            continue
+        else:
+            array = getattr(values.array, "_data", values.to_numpy())
+        if isinstance(array, np.ndarray) and not array.flags.writeable:
+            shared += nbytes
+    return shared / total if total else 0.0
+
+
+def load_all():
+    """{dataset: frame} of every dataset ``covid.datasets`` can load here."""
+    from covid import datasets
+
+    loaders = [name for name in dir(datasets) if name.startswith("load_") and name != "load_source"
+               and name != "load_by_countries"]
+    frames = {}
+    for name in loaders:
+        try:
+            frames[name[5:]] = getattr(datasets, name)()
+        except FileNotFoundError:
+            continue
+    return frames
+
+
+def _hold(load):
+    """Worker of ``measure``: load (or only import) the datasets, say so, and wait for stdin to close."""
+    import geopandas  # noqa: F401
+    import pyarrow  # noqa: F401
+
+    from covid import datasets  # noqa: F401
+
+    frames = load_all() if load else {}
+    print(f"ready {len(frames)}", flush=True)
+    sys.stdin.read()
+
+
+def measure(processes, mode, directory):
+    """(RSS, PSS) in MB summed over ``processes`` that have loaded every dataset.
+
+    ``mode`` is "off" or "on" for ``COVID_SHARED_DATA``, or "bare" for
+    processes that import the same modules and load nothing. Processes are
+    started one after the other, so with sharing on the first publishes.
+    """
+    from covid import loadtest, timing
+
+    env = dict(os.environ, COVID_SHARED_DATA="1" if mode == "on" else "0", COVID_SHARED_DIR=directory,
+               PYTHONPATH=timing.ROOT_DIR, PYTHONWARNINGS="ignore")
+    started = []
+    try:
+        for _ in range(processes):
+            process = subprocess.Popen([sys.executable, "-m", "covid.shared", "--hold", mode], env=env,
+                                       stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+            started.append(process)
+            if not process.stdout.readline().startswith("ready"):
+                raise RuntimeError(f"worker {process.pid} exited with {process.wait()}")
+        return loadtest.memory_mb([process.pid for process in started])
+    finally:
+        for process in started:
+            process.stdin.close()
+            process.wait()
+
+
+def memory_report(processes):
+    print(f"{'mode':6} {'RSS MB':>8} {'PSS MB':>8} {'data PSS MB/process':>20}")
+    with tempfile.TemporaryDirectory() as directory:
+        memory = {mode: measure(processes, mode, directory) for mode in ("bare", "off", "on")}
+    for mode, (rss, pss) in memory.items():
+        print(f"{mode:6} {rss:8.0f} {pss:8.0f} {(pss - memory['bare'][1]) / processes:20.1f}")
+    print(f"{processes} processes")
+
+
+def main(args):
+    if args[:1] == ["--hold"]:
+        return _hold(args[1] != "bare")
+    options = dict(zip(args[::2], args[1::2]))
+    if "--processes" in options:
+        return memory_report(int(options["--processes"]))
+
+    os.environ["COVID_SHARED_DATA"] = "1"
+    from covid import datasets, schema
+
+    print(f"{'dataset':28} {'rows':>6} {'MB':>8} {'zero-copy':>10}")
+    for name, loaded in load_all().items():
+        nbytes = datasets.frame_nbytes(loaded) + schema.geometry_nbytes(loaded)
+        print(f"{name:28} {len(loaded):6} {nbytes / 1e6:8.2f} {zero_copy_share(loaded):10.0%}")
+    print(f"published in {SHARED_DIR}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,105 @@
+"""Cold-start report for the app's scripts.
+
+    python -m covid.startup                      # Home.py and every page
+    python -m covid.startup pages/2_Efficacy.py  # selected scripts
+
+For each script, in a fresh interpreter that has already imported
+streamlit (as the server process has by the time a page runs):
+
+* ``imports``: seconds spent in the script's module-level import
+  statements, with the modules that cost the most (``python -X importtime``);
+* ``cold run``: seconds for the first run of the whole script in Streamlit's
+  bare mode (widgets at their defaults), imports included.
+"""
+import ast
+import glob
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+from covid import datasets
+
+REPEAT = 3
+TOP = 8
+_IMPORTTIME = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)")
+
+
+def scripts():
+    """Home.py and the pages, in sidebar order."""
+    return [os.path.join(datasets.ROOT_DIR, "Home.py")] + \
+        sorted(glob.glob(os.path.join(datasets.ROOT_DIR, "pages", "*.py")))
+
+
+def module_imports(script):
+    """Source of the import statements at the top level of ``script``."""
+    with open(script, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), script)
+    nodes = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+    return "\n".join(ast.unparse(node) for node in nodes)
+
+
+def _python(code, *flags):
+    """Run ``code`` in a fresh interpreter after ``import streamlit``; return (stdout, stderr)."""
+    env = dict(os.environ, PYTHONPATH=datasets.ROOT_DIR, PYTHONWARNINGS="ignore")
+    done = subprocess.run([sys.executable, *flags, "-c", f"import streamlit\n{code}"],
+                          cwd=datasets.ROOT_DIR, env=env, capture_output=True, text=True)
+    if done.returncode:
+        raise RuntimeError(f"{code!r} failed:\n{done.stderr[-2000:]}")
+    return done.stdout, done.stderr
+
+
+def _timed(code, *flags):
+    out, err = _python(f"import time\n_start = time.perf_counter()\n{code}\n"
+                       f"print(time.perf_counter() - _start)", *flags)
+    return float(out.split()[-1]), err
+
+
+def import_seconds(script):
+    return _timed(module_imports(script))[0]
+
+
+def import_costs(script):
+    """{top-level module: cumulative import seconds} for what ``script`` imports beyond streamlit."""
+    _, log = _timed(module_imports(script), "-X", "importtime")
+    costs, seen, started = {}, set(), False
+    for match in _IMPORTTIME.finditer(log):
+        name = match.group(4).split(".")[0]
+        if not started:
+            # everything up to and including streamlit is interpreter and server start-up
+            seen.add(name)
+            started = name == "streamlit" and len(match.group(3)) == 1
+            continue
+        # importtime indents nested imports; depth 1 is what the script asked for
+        if len(match.group(3)) == 1 and name not in seen:
+            costs[name] = costs.get(name, 0) + int(match.group(2)) / 1e6
+    return dict(sorted(costs.items(), key=lambda item: -item[1]))
+
+
+def cold_run(script):
+    """Seconds for the first run of ``script`` in bare mode."""
+    code = (f"import runpy, logging\nlogging.disable(logging.WARNING)\n"
+            f"runpy.run_path({script!r}, run_name='__main__')")
+    return _timed(code)[0]
+
+
+def report(paths=None, repeat=REPEAT):
+    rows = []
+    for script in paths or scripts():
+        imports = statistics.median(import_seconds(script) for _ in range(repeat))
+        try:
+            run = statistics.median(cold_run(script) for _ in range(repeat))
+        except RuntimeError as e:
+            print(f"{script}: {str(e).strip().splitlines()[-1]}", file=sys.stderr)
+            run = float("nan")
+        costs = import_costs(script)
+        top = ", ".join(f"{name} {seconds:.2f}" for name, seconds in list(costs.items())[:TOP])
+        rows.append((os.path.relpath(script, datasets.ROOT_DIR), imports, run, top))
+    return rows
+
+
+if __name__ == "__main__":
+    print(f"{'script':36} {'imports':>8} {'cold run':>9}  heaviest imports (s)")
+    for name, imports, run, top in report([os.path.abspath(p) for p in sys.argv[1:]]):
+        print(f"{name:36} {imports:8.2f} {run:9.2f}  {top}")
@@ -0,0 +1,176 @@
+"""Parquet / GeoParquet copies of the datasets in ``data/``.
+
+Parsing the xlsx files through openpyxl and the shapefiles through GDAL is
+most of a page's cold load. ``python -m covid.storage`` writes a columnar
+copy of every dataset to ``data/binary/`` (geometry as WKB) and stamps it
+with the sha1 of the file it came from. ``covid.datasets`` reads the copy
+when that stamp still matches the original and falls back to the original
+otherwise, so a stale copy is never served.
+"""
+import json
+import os
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+GEO_KEY = b"geo"
+SOURCE_DIGEST_KEY = b"covid:source_sha1"
+MIXED_COLUMNS_KEY = b"covid:mixed_columns"
+
+_lock = threading.Lock()
+_stamps = {}  # binary path -> (mtime_ns, size, source digest)
+
+
+def binary_path(source, binary_dir):
+    """Where the columnar copy of ``source`` lives."""
+    name = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(binary_dir, name + ".parquet")
+
+
+def source_stamp(binary):
+    """Digest of the source a binary copy was written from, or None."""
+    try:
+        st = os.stat(binary)
+    except FileNotFoundError:
+        return None
+    with _lock:
+        known = _stamps.get(binary)
+        if known is not None and known[:2] == (st.st_mtime_ns, st.st_size):
+            return known[2]
+    import pyarrow.parquet as pq
+    metadata = pq.read_schema(binary).metadata or {}
+    stamp = metadata.get(SOURCE_DIGEST_KEY, b"").decode() or None
+    with _lock:
+        _stamps[binary] = (st.st_mtime_ns, st.st_size, stamp)
+    return stamp
+
+
+def is_fresh(binary, digest):
+    """True when ``binary`` was written from a source with this digest."""
+    return source_stamp(binary) == digest
+
+
+def to_arrow(frame):
+    """An Arrow table of ``frame``; geometry columns become WKB described by GeoParquet ``geo`` metadata."""
+    import pyarrow as pa
+
+    if not hasattr(frame, "to_wkb"):
+        return pa.Table.from_pandas(frame)
+    columns = {}
+    for col in frame.columns[(frame.dtypes == "geometry").to_numpy()]:
+        crs = frame[col].crs
+        columns[col] = {"encoding": "WKB", "geometry_types": [],
+                        "crs": crs.to_json_dict() if crs is not None else None}
+    table = pa.Table.from_pandas(pd.DataFrame(frame.to_wkb()))
+    geo = {"version": "1.0.0", "primary_column": frame.geometry.name, "columns": columns}
+    metadata = dict(table.schema.metadata or {})
+    metadata[GEO_KEY] = json.dumps(geo).encode()
+    return table.replace_schema_metadata(metadata)
+
+
+def from_arrow(table, **options):
+    """The frame ``to_arrow`` encoded: a GeoDataFrame when ``table`` has ``geo`` metadata.
+
+    ``options`` go to ``pyarrow.Table.to_pandas``.
+    """
+    frame = table.to_pandas(**options)
+    metadata = table.schema.metadata or {}
+    if GEO_KEY not in metadata:
+        return frame
+    import geopandas
+
+    geo = json.loads(metadata[GEO_KEY])
+    for col, spec in geo["columns"].items():
+        # GeoParquet reads a missing crs as OGC:CRS84 and a null one as none
+        frame[col] = geopandas.GeoSeries.from_wkb(frame[col].to_numpy(), index=frame.index,
+                                                  crs=spec.get("crs", "OGC:CRS84"))
+    return geopandas.GeoDataFrame(frame, geometry=geo["primary_column"])
+
+
+def _mixed_columns(frame):
+    # object columns holding both text and numbers (e.g. the second header
+    # row of the efficacy sheet) have no parquet type; they are stored as
+    # text and turned back into numbers on read
+    mixed = []
+    for col in frame.columns:
+        if frame[col].dtype != object or col == getattr(frame, "_geometry_column_name", None):
+            continue
+        kinds = {type(v) for v in frame[col].dropna()}
+        if str in kinds and len(kinds) > 1:
+            mixed.append(col)
+    return mixed
+
+
+def _restore(value):
+    if not isinstance(value, str):
+        return value
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+def write_binary(frame, binary, digest):
+    """Write ``frame`` to ``binary`` atomically, stamped with ``digest``."""
+    import pyarrow.parquet as pq
+
+    mixed = _mixed_columns(frame)
+    if mixed:
+        frame = frame.copy()
+        for col in mixed:
+            frame[col] = frame[col].map(lambda v: v if pd.isna(v) else str(v))
+
+    table = to_arrow(frame)
+    metadata = dict(table.schema.metadata or {})
+    metadata[SOURCE_DIGEST_KEY] = digest.encode()
+    metadata[MIXED_COLUMNS_KEY] = json.dumps(mixed).encode()
+    table = table.replace_schema_metadata(metadata)
+
+    os.makedirs(os.path.dirname(binary), exist_ok=True)
+    tmp = binary + ".tmp"
+    pq.write_table(table, tmp)
+    os.replace(tmp, binary)
+
+
+def read_binary(binary):
+    """Read a file written by ``write_binary``; GeoParquet comes back as a GeoDataFrame."""
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(binary)
+    metadata = table.schema.metadata or {}
+    frame = from_arrow(table)
+    for col in json.loads(metadata.get(MIXED_COLUMNS_KEY, b"[]")):
+        frame[col] = frame[col].map(_restore).astype(object)
+    # Arrow gives None for a missing string; the text readers give NaN
+    geometry = frame.geometry.name if GEO_KEY in metadata else None
+    for col in frame.columns[(frame.dtypes == object).to_numpy()]:
+        if col != geometry:
+            frame[col] = frame[col].where(frame[col].notna(), np.nan)
+    return frame
+
+
+def convert_all(force=False):
+    """Write a binary copy of every registered dataset; return the paths written."""
+    from covid import datasets
+
+    written = []
+    for source, reader in datasets.sources():
+        if not os.path.exists(source):
+            print(f"skip {source}: not found")
+            continue
+        digest = datasets.source_digest(source)
+        binary = binary_path(source, datasets.BINARY_DIR)
+        if not force and is_fresh(binary, digest):
+            continue
+        write_binary(reader(source), binary, digest)
+        written.append(binary)
+        print(f"wrote {os.path.relpath(binary, datasets.ROOT_DIR)}")
+    return written
+
+
+if __name__ == "__main__":
+    convert_all(force="--force" in sys.argv[1:])
@@ -0,0 +1,213 @@
+"""Protection and infection of every country over a grid of scenarios.
+
+The Breakthrough Infection formulas, for coverage levels and efficacy
+multipliers instead of the reported values::
+
+    Protection = coverage * clip(multiplier * E, 0, 100) / 100
+    Infection  = 100 - Protection
+
+where ``E`` is a country's average infection efficacy for a variant. The
+grid is evaluated by broadcasting the country x variant efficacy array
+against the levels and multipliers, into a float32 cube of shape
+(country, coverage, multiplier, variant, measure). It is stored as ``.npy``
+in ``COVID_SWEEP_DIR`` (default ``data/cache/sweep``), with its axes in
+``axes.json``, and rebuilt only when the inputs or the grid change.
+``load`` memory-maps it, so slicing one country reads only that country's
+block. It is built here or by ``python -m covid.etl``, never by a page.
+
+A cube of more than ``COVID_SWEEP_CHUNK_MB`` is computed in chunks of
+countries on a process pool of ``COVID_SWEEP_WORKERS``, each worker writing
+its chunk straight into the file.
+
+    python -m covid.sweep                                            # default grid
+    python -m covid.sweep --coverage 0:100:0.5 --multipliers 0.5:1.5:0.01
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from covid import datasets, joins, timing, whatif
+
+SWEEP_DIR = os.environ.get("COVID_SWEEP_DIR", os.path.join(datasets.DATA_DIR, "cache", "sweep"))
+AXES = os.path.join(SWEEP_DIR, "axes.json")
+CHUNK_MB = float(os.environ.get("COVID_SWEEP_CHUNK_MB", 256))
+WORKERS = int(os.environ.get("COVID_SWEEP_WORKERS", min(4, os.cpu_count() or 1)))
+
+MEASURES = ("Protection", "Infection")
+COVERAGE_LEVELS = "0:100:5"
+MULTIPLIERS = "0.5:1.5:0.1"
+
+_lock = threading.Lock()
+_cubes = {}  # cube file -> memory-mapped array
+
+
+def grid(spec):
+    """Values of an inclusive "start:stop:step" range, rounded to the step's decimals."""
+    start, stop, step = (float(x) for x in spec.split(":"))
+    decimals = len(f"{step:g}".partition(".")[2])
+    return np.round(np.arange(start, stop + step / 2, step), decimals)
+
+
+def evaluate(efficacy, coverage, multipliers):
+    """(country, coverage, multiplier, variant, measure) block for a country x variant ``efficacy`` array."""
+    effective = np.clip(efficacy[:, None, :] * multipliers[None, :, None], 0, 100)
+    protection = coverage[None, :, None, None] * effective[:, None, :, :] / 100
+    block = np.empty(protection.shape + (len(MEASURES),), dtype=np.float32)
+    block[..., 0] = protection
+    block[..., 1] = 100 - protection
+    return block
+
+
+def _fill(path, start, efficacy, coverage, multipliers):
+    """Worker: evaluate one chunk of countries into the cube file."""
+    cube = np.load(path, mmap_mode="r+")
+    cube[start:start + len(efficacy)] = evaluate(efficacy, coverage, multipliers)
+    cube.flush()
+
+
+def inputs():
+    """names, reported coverage, country x variant infection efficacy and variants of page 3's countries."""
+    world = datasets.load_world_coverage()
+    df_country_efficacy = datasets.load_country_efficacy()
+    variants = whatif.variants_of(df_country_efficacy)
+    joined = joins.join_efficacy(world[["name"]], df_country_efficacy, variants)
+    efficacy = joined[[f"{v} Infection Efficacy" for v in variants]].to_numpy(dtype=float)
+    coverage = world["% People Fully Vaccinated"].to_numpy(dtype=float, na_value=np.nan)
+    return list(world["name"]), coverage, efficacy, variants
+
+
+def sweep_key(coverage, multipliers):
+    sha = hashlib.sha1()
+    for path in (datasets.WORLD_COVERAGE_PARQUET, datasets.COUNTRY_EFFICACY_CSV):
+        sha.update(datasets.source_digest(path).encode())
+    sha.update(np.asarray(coverage, dtype=float).tobytes())
+    sha.update(np.asarray(multipliers, dtype=float).tobytes())
+    return sha.hexdigest()[:16]
+
+
+def read_axes():
+    try:
+        with open(AXES) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+@timing.timed("parameter sweep")
+def build(coverage, multipliers, workers=None):
+    """Evaluate the grid and store it with its axes; returns the axes."""
+    workers = WORKERS if workers is None else workers
+    names, reported, efficacy, variants = inputs()
+    key = sweep_key(coverage, multipliers)
+    shape = (len(names), len(coverage), len(multipliers), len(variants), len(MEASURES))
+    # the float64 intermediates of one country plus its float32 cells
+    per_country = len(coverage) * len(multipliers) * len(variants) * (8 + 4 * len(MEASURES))
+    rows = max(1, int(CHUNK_MB * 1e6 // per_country))
+
+    os.makedirs(SWEEP_DIR, exist_ok=True)
+    path = os.path.join(SWEEP_DIR, f"cube-{key}.npy")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    cube = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=shape)
+    starts = range(0, len(names), rows)
+    try:
+        if len(starts) > 1 and workers > 1:
+            import multiprocessing
+
+            cube.flush()
+            # spawn, not fork: the Streamlit server process has threads running
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                for future in [pool.submit(_fill, tmp, s, efficacy[s:s + rows], coverage, multipliers)
+                               for s in starts]:
+                    future.result()
+        else:
+            for s in starts:
+                cube[s:s + rows] = evaluate(efficacy[s:s + rows], coverage, multipliers)
+        cube.flush()
+        del cube
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    axes = {"key": key, "file": os.path.basename(path), "countries": names,
+            "reported_coverage": [None if np.isnan(c) else float(c) for c in reported],
+            "coverage": [float(c) for c in coverage], "multipliers": [float(m) for m in multipliers],
+            "variants": variants, "measures": list(MEASURES)}
+    with open(AXES + ".tmp", "w") as f:
+        json.dump(axes, f)
+    os.replace(AXES + ".tmp", AXES)
+    for name in os.listdir(SWEEP_DIR):
+        if name.startswith("cube-") and name.endswith(".npy") and name != axes["file"]:
+            os.remove(os.path.join(SWEEP_DIR, name))
+    return axes
+
+
+def ensure(coverage=None, multipliers=None):
+    """Axes of an up-to-date cube, built if needed.
+
+    Without a grid, the stored one is kept if its inputs have not changed;
+    otherwise the default grid is built.
+    """
+    with _lock:
+        axes = read_axes()
+        if coverage is None and multipliers is None and axes:
+            coverage, multipliers = axes["coverage"], axes["multipliers"]
+        coverage = grid(COVERAGE_LEVELS) if coverage is None else np.asarray(coverage, dtype=float)
+        multipliers = grid(MULTIPLIERS) if multipliers is None else np.asarray(multipliers, dtype=float)
+        if axes.get("key") != sweep_key(coverage, multipliers) \
+                or not os.path.exists(os.path.join(SWEEP_DIR, axes["file"])):
+            axes = build(coverage, multipliers)
+        return axes
+
+
+def is_current(axes):
+    """True when the stored cube was built from the present inputs."""
+    return axes.get("key") == sweep_key(axes["coverage"], axes["multipliers"])
+
+
+@timing.timed("load sweep cube")
+def load():
+    """(cube, axes): the stored cube memory-mapped read-only, shared by every session.
+
+    Never builds it, so a page render does not start the pool; the cube is
+    (None, axes) until ``python -m covid.sweep`` or ``python -m covid.etl``
+    has built it.
+    """
+    axes = read_axes()
+    path = axes and os.path.join(SWEEP_DIR, axes["file"])
+    if not path or not os.path.exists(path):
+        return None, axes
+    with _lock:
+        if path not in _cubes:
+            _cubes.clear()
+            _cubes[path] = np.load(path, mmap_mode="r")
+        return _cubes[path], axes
+
+
+def country_frame(cube, axes, country, measure="Infection", multiplier=1.0):
+    """One country's ``measure`` by coverage level (rows) and variant (columns) at ``multiplier``."""
+    import pandas as pd
+
+    i = axes["countries"].index(country)
+    j = int(np.argmin(np.abs(np.asarray(axes["multipliers"]) - multiplier)))
+    values = cube[i, :, j, :, axes["measures"].index(measure)]
+    return pd.DataFrame(np.asarray(values, dtype=float), index=pd.Index(axes["coverage"], name="coverage"),
+                        columns=axes["variants"])
+
+
+def main(args):
+    options = dict(zip(args[::2], args[1::2]))
+    axes = ensure(grid(options.get("--coverage", COVERAGE_LEVELS)),
+                  grid(options.get("--multipliers", MULTIPLIERS)))
+    shape = [len(axes[a]) for a in ("countries", "coverage", "multipliers", "variants", "measures")]
+    print(f"{os.path.join(SWEEP_DIR, axes['file'])}: {' x '.join(map(str, shape))}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,136 @@
+"""Per-stage timing of page runs.
+
+    COVID_TIMING=1 streamlit run Home.py     # every page, every session
+    http://localhost:8501/Dashboard?timing=1 # one session
+
+A page calls ``begin(page)`` first and ``report()`` last. In between, code
+marks its stages with ``with stage("name"):`` or the ``@timed("name")``
+decorator; stages may nest. When timing is off (the default), ``stage``
+hands back a shared no-op context manager and ``timed`` functions only look
+up one thread-local attribute, so the marks can stay in place.
+
+When timing is on, ``report`` shows the run's stages in the sidebar and
+appends one JSON line per run to ``COVID_TIMING_LOG`` (default
+``data/cache/timing.jsonl``)::
+
+    {"time": ..., "page": "Dashboard", "seconds": 1.23,
+     "stages": [{"stage": "load vaccinations xlsx", "start": 0.01, "seconds": 0.2, "depth": 0}, ...]}
+
+``begin`` and ``report`` also start and stop ``covid.profiling`` when a
+profile is requested.
+"""
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+# no covid imports here: the loaders themselves are timed
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOG = os.environ.get("COVID_TIMING_LOG", os.path.join(ROOT_DIR, "data", "cache", "timing.jsonl"))
+
+_local = threading.local()  # .run: the current run's record on this script thread, or None
+_log_lock = threading.Lock()
+_OFF = contextlib.nullcontext()
+
+
+def env_enabled():
+    return os.environ.get("COVID_TIMING", "") not in ("", "0")
+
+
+def query_param(name):
+    """Value of the page URL's query parameter ``name``, or None."""
+    import streamlit as st
+
+    if hasattr(st, "query_params"):
+        return st.query_params.get(name)
+    return st.experimental_get_query_params().get(name, [None])[0]
+
+
+def begin(page):
+    """Start timing a run of ``page`` if timing is enabled for it, and profiling if armed."""
+    from covid import profiling
+
+    enabled = env_enabled() or query_param("timing") not in (None, "", "0")
+    _local.run = {"page": page, "start": time.perf_counter(), "stages": [], "depth": 0} \
+        if enabled else None
+    _local.profile = (page, profiling.start())
+
+
+class _Stage:
+    __slots__ = ("run", "name", "start")
+
+    def __init__(self, run, name):
+        self.run = run
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.run["depth"] += 1
+
+    def __exit__(self, *exc):
+        run = self.run
+        run["depth"] -= 1
+        run["stages"].append({"stage": self.name, "start": self.start - run["start"],
+                              "seconds": time.perf_counter() - self.start, "depth": run["depth"]})
+
+
+def stage(name):
+    """Context manager timing the enclosed block as stage ``name``."""
+    run = getattr(_local, "run", None)
+    return _OFF if run is None else _Stage(run, name)
+
+
+def timed(name):
+    """Decorator timing every call of the function as stage ``name``."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            run = getattr(_local, "run", None)
+            if run is None:
+                return function(*args, **kwargs)
+            with _Stage(run, name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def finish():
+    """End the current run and return its record (None when timing is off)."""
+    run = getattr(_local, "run", None)
+    _local.run = None
+    if run is None:
+        return None
+    stages = sorted(run["stages"], key=lambda s: s["start"])
+    return {"time": time.time(), "page": run["page"],
+            "seconds": time.perf_counter() - run["start"], "stages": stages}
+
+
+def append_log(record, path=None):
+    path = path or LOG
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    line = json.dumps(record) + "\n"
+    with _log_lock, open(path, "a", encoding="utf-8") as f:
+        f.write(line)
+
+
+def report():
+    """End the run; show and log its timings, and write its profile, if taken."""
+    import streamlit as st
+
+    page, profiler = getattr(_local, "profile", (None, None))
+    _local.profile = (None, None)
+    if profiler is not None:
+        from covid import profiling
+
+        path = profiling.stop(profiler, page)
+        st.sidebar.caption(f"Profile: {os.path.relpath(path, ROOT_DIR)}")
+    record = finish()
+    if record is None:
+        return
+    append_log(record)
+    lines = [f"{'&nbsp;' * 4 * s['depth']}{s['stage']}: {s['seconds'] * 1000:.0f} ms"
+             for s in record["stages"]]
+    with st.sidebar.expander(f"Timing: {record['seconds'] * 1000:.0f} ms", expanded=True):
+        st.markdown("  \n".join(lines) or "no stages")
@@ -0,0 +1,136 @@
+"""Monte Carlo uncertainty bands for the Breakthrough Infection rates.
+
+The efficacy sheet gives point estimates, and the coverage numbers are
+reports. ``bands`` samples both and pushes every sample through the same
+formulas the pages use:
+
+* each manufacturer's efficacy per variant is drawn around the sheet's
+  value (normal, ``COVID_MC_EFFICACY_SD`` points), once per sample for all
+  countries, and a country's efficacy moves by its dose-weighted average of
+  those draws (the Efficacy page's weighting, as in ``whatif``). Countries
+  without doses by manufacturer get a draw of their own;
+* each country's coverage is drawn around its report (normal,
+  ``COVID_MC_COVERAGE_SD`` of the value);
+* Protection = coverage * E / 100 and Infection = 100 - Protection.
+
+Draws are clipped to valid percentages. Samples are evaluated as samples x
+countries x variants arrays, in chunks of ``CHUNK`` samples, each with its
+own seed spawned from ``COVID_MC_SEED``. The bands are the same for any
+number of workers (``COVID_MC_WORKERS``, a process pool when above 1).
+
+    python -m covid.uncertainty     # 2.5 / 50 / 97.5 percentiles of Omicron Infection
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from covid import datasets, timing, whatif
+
+SAMPLES = int(os.environ.get("COVID_MC_SAMPLES", 10000))
+SEED = int(os.environ.get("COVID_MC_SEED", 20221228))
+EFFICACY_SD = float(os.environ.get("COVID_MC_EFFICACY_SD", 5))
+COVERAGE_SD = float(os.environ.get("COVID_MC_COVERAGE_SD", 0.05))
+WORKERS = int(os.environ.get("COVID_MC_WORKERS", min(4, os.cpu_count() or 1)))
+CHUNK = 1000
+MEASURES = ("Protection", "Infection")
+PERCENTILES = (2.5, 50, 97.5)
+
+_lock = threading.Lock()
+_bands = {}  # inputs and parameters -> bands frame
+_pool = None
+
+
+def simulate(seed, size, coverage, efficacy, weights, matrix, efficacy_sd=EFFICACY_SD,
+             coverage_sd=COVERAGE_SD):
+    """Protection of ``size`` samples, as a float32 samples x countries x variants array.
+
+    ``coverage`` (n) and ``efficacy`` (n x k) are the reported values,
+    ``weights`` (n x m) the dose shares and ``matrix`` (m x k) the
+    manufacturer efficacies.
+    """
+    rng = np.random.default_rng(seed)
+    n, k = efficacy.shape
+    weighted = weights.sum(axis=1) > 0
+
+    drawn = np.clip(matrix + efficacy_sd * rng.standard_normal((size,) + matrix.shape), 0, 100)
+    shift = np.einsum("nm,smk->snk", weights, drawn - matrix)
+    own = efficacy_sd * rng.standard_normal((size, n, k))
+    shift[:, ~weighted] = own[:, ~weighted]
+    sampled_efficacy = np.clip(efficacy + shift, 0, 100)
+
+    sampled_coverage = np.clip(coverage * (1 + coverage_sd * rng.standard_normal((size, n))), 0, None)
+    return (sampled_coverage[:, :, None] * sampled_efficacy / 100).astype(np.float32)
+
+
+def _get_pool(workers):
+    global _pool
+    import multiprocessing
+
+    with _lock:
+        if _pool is None:
+            # spawn, not fork: the Streamlit server process has threads running
+            _pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+@timing.timed("uncertainty bands")
+def bands(scenario, samples=SAMPLES, seed=SEED, efficacy_sd=EFFICACY_SD, coverage_sd=COVERAGE_SD,
+          workers=None):
+    """Percentiles of each country's Protection and Infection over ``samples`` draws.
+
+    ``scenario`` is a ``whatif.Scenario`` at its reported values. Returns a
+    frame of 'name' and '<variant> <measure> low' / 'median' / 'high'
+    columns, with the 2.5th, 50th and 97.5th percentiles.
+    """
+    workers = WORKERS if workers is None else workers
+    sizes = [min(CHUNK, samples - start) for start in range(0, samples, CHUNK)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    arguments = (scenario.base_coverage, scenario.base_efficacy, scenario.weights, scenario.matrix,
+                 efficacy_sd, coverage_sd)
+    if len(sizes) > 1 and workers > 1:
+        pool = _get_pool(workers)
+        futures = [pool.submit(simulate, s, size, *arguments) for s, size in zip(seeds, sizes)]
+        protection = np.concatenate([future.result() for future in futures])
+    else:
+        protection = np.concatenate([simulate(s, size, *arguments) for s, size in zip(seeds, sizes)])
+
+    low, median, high = np.percentile(protection, PERCENTILES, axis=0)
+    columns = {"name": scenario.names}
+    for j, v in enumerate(scenario.variants):
+        columns.update({f"{v} Protection low": low[:, j], f"{v} Protection median": median[:, j],
+                        f"{v} Protection high": high[:, j],
+                        f"{v} Infection low": 100 - high[:, j], f"{v} Infection median": 100 - median[:, j],
+                        f"{v} Infection high": 100 - low[:, j]})
+    return pd.DataFrame(columns)
+
+
+def load_bands(world, samples=SAMPLES, seed=SEED):
+    """``bands`` of page 3's countries, computed once per process for each input version."""
+    source = whatif.dose_source()
+    key = (datasets.source_digest(datasets.WORLD_COVERAGE_PARQUET),
+           datasets.source_digest(datasets.COUNTRY_EFFICACY_CSV),
+           datasets.source_digest(datasets.EFFICACY_XLSX),
+           source and datasets.source_digest(source), samples, seed, EFFICACY_SD, COVERAGE_SD)
+    with _lock:
+        if key in _bands:
+            return _bands[key]
+    scenario = whatif.Scenario.from_world(world, datasets.load_country_efficacy(), whatif.dose_rows(),
+                                          datasets.load_efficacy())
+    result = bands(scenario, samples, seed)
+    with _lock:
+        _bands.clear()
+        _bands[key] = result
+    return result
+
+
+if __name__ == "__main__":
+    import time
+
+    start = time.perf_counter()
+    result = load_bands(datasets.load_world_coverage())
+    columns = ["name"] + [f"Omicron Infection {p}" for p in ("low", "median", "high")]
+    print(result[columns].dropna().to_string(index=False, float_format="{:.1f}".format))
+    print(f"{SAMPLES} samples in {time.perf_counter() - start:.1f} s")
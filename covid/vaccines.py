@@ -0,0 +1,62 @@
+"""Which manufacturers' vaccines each country uses, from WHO's VACCINES_USED.
+
+VACCINES_USED is a comma-separated list of "<developer> - <product>"
+entries, e.g. "Pfizer BioNTech - Comirnaty,SII - Covishield". ``usage``
+parses each distinct list once into a country x manufacturer boolean
+matrix, so "does country c use X" and "how many countries use X" are
+column lookups and sums instead of a substring search per country.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+# developer names as the WHO sheet writes them -> names used on the pages
+ALIASES = {"Pfizer BioNTech": "Pfizer", "Beijing CNBG": "BBIBP"}
+# the sheet has a few en dashes mis-decoded as cp1252
+_DASH = re.compile(r"\s*(?:-|–|â€“)\s*")
+
+
+def manufacturer(entry):
+    """Normalized manufacturer of one VACCINES_USED entry, e.g. 'Moderna - Spikevax' -> 'Moderna'."""
+    name = _DASH.split(entry.strip(), maxsplit=1)[0]
+    return ALIASES.get(name, name)
+
+
+def parse(vaccines_used):
+    """Set of manufacturers in one VACCINES_USED value; empty for a missing value."""
+    if not isinstance(vaccines_used, str):
+        return set()
+    return {manufacturer(entry) for entry in vaccines_used.split(",") if entry.strip()}
+
+
+def usage(vaccines_used):
+    """Boolean frame, one row per entry of ``vaccines_used`` and one column per manufacturer.
+
+    Columns are the manufacturers that occur, sorted; the index is the
+    index of ``vaccines_used``.
+    """
+    codes, uniques = pd.factorize(vaccines_used)
+    parsed = [parse(value) for value in uniques]
+    vocabulary = sorted(set().union(*parsed))
+    columns = {name: j for j, name in enumerate(vocabulary)}
+    # one extra all-False row that code -1 (a missing value) picks up
+    table = np.zeros((len(uniques) + 1, len(vocabulary)), dtype=bool)
+    for i, names in enumerate(parsed):
+        table[i, [columns[name] for name in names]] = True
+    return pd.DataFrame(table[codes], index=vaccines_used.index, columns=vocabulary)
+
+
+def long_form(frame, used, manufacturers, columns, labels=None):
+    """One row per (manufacturer, country using it), for a plotly animation.
+
+    Rows are grouped by manufacturer in the order given, countries in frame
+    order within each group. Only ``columns`` of ``frame`` are taken, so the
+    geometry is not copied. ``labels`` renames manufacturers in the
+    'vaccine' column.
+    """
+    manufacturers = list(manufacturers)
+    vaccine, row = np.nonzero(used[manufacturers].to_numpy().T)
+    long = pd.DataFrame(frame[columns]).iloc[row]
+    long["vaccine"] = np.asarray([(labels or {}).get(m, m) for m in manufacturers])[vaccine]
+    return long
@@ -0,0 +1,186 @@
+"""What-if scenarios for breakthrough infection.
+
+``breakthrough.add_rates`` derives three rates from a country's coverage
+(% people fully vaccinated) and its average infection efficacy ``E`` for a
+variant::
+
+    Breakthrough Infection = 100 - E
+    Protection             = coverage * E / 100
+    Infection              = 100 - Protection
+
+A ``Scenario`` holds these as country x variant arrays, for every variant
+in the country efficacy table. Users can scale efficacy per variant and
+per manufacturer, and override coverage per country. ``update`` compares
+the requested scenario with the current one and recomputes only the cells
+that depend on what changed:
+
+* a variant's scale changes its column;
+* a country's coverage changes its row;
+* a manufacturer's scale changes the rows of the countries that used it,
+  through their dose weights. ``E = E0 + W @ ((scale - 1) * M)``, where
+  ``W`` is the country x manufacturer dose share and ``M`` is the
+  manufacturer x variant efficacy.
+
+With no adjustments the values equal ``add_rates``'. Per-manufacturer
+scaling needs the doses by manufacturer (``dose_rows``); without them only
+variants and coverage can be adjusted.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from covid import datasets, efficacy, joins
+
+MEASURES = ("Infection Efficacy", "Breakthrough Infection", "Protection", "Infection")
+
+
+def variants_of(df_country_efficacy):
+    """Variants with an infection efficacy column, in table order."""
+    return [c[:-len(" Infection")] for c in df_country_efficacy.columns if c.endswith(" Infection")]
+
+
+def population_average(values, population):
+    """Population-weighted mean of ``values`` over the countries where both are known; NaN if none are."""
+    known = ~np.isnan(values) & ~np.isnan(population) & (population > 0)
+    if not known.any():
+        return np.nan
+    return float(np.average(values[known], weights=population[known]))
+
+
+def dose_source():
+    """File the doses by manufacturer come from: the manufacturer sheet, else the cached OWID feed; or None."""
+    from covid import owid
+
+    for path in (datasets.MANUFACTURER_EFFICACY_XLSX, owid.SNAPSHOT):
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def dose_rows():
+    """country / vaccine / total vaccinations rows of the latest doses by manufacturer, or None.
+
+    The OWID feed is read as cached, without refreshing it.
+    """
+    source = dose_source()
+    if source == datasets.MANUFACTURER_EFFICACY_XLSX:
+        return efficacy.vaccine_doses(efficacy.latest_records(datasets.load_manufacturer_efficacy()))
+    if source is not None:
+        feed = datasets.load_source(source, pd.read_csv, "owid_manufacturer")
+        latest = efficacy.latest_records(feed, keys=("location", "vaccine"), date="date", skip_rows=0)
+        return efficacy.vaccine_doses(latest, "location", "vaccine", "total_vaccinations")
+    return None
+
+
+class Scenario:
+    """Breakthrough rates of ``n`` countries x ``k`` variants under adjustable inputs.
+
+    ``values[measure]`` is the current n x k array of each of ``MEASURES``,
+    ``baseline[measure]`` the same with nothing adjusted.
+    """
+
+    def __init__(self, names, coverage, efficacies, variants, weights=None, matrix=None,
+                 manufacturers=()):
+        self.names = np.asarray(names, dtype=object)
+        self.variants = list(variants)
+        self.manufacturers = list(manufacturers)
+        n, k, m = len(self.names), len(self.variants), len(self.manufacturers)
+        self.base_coverage = np.asarray(coverage, dtype=float)
+        self.base_efficacy = np.asarray(efficacies, dtype=float).reshape(n, k)
+        self.weights = np.zeros((n, m)) if weights is None else np.asarray(weights, dtype=float)
+        self.matrix = np.zeros((m, k)) if matrix is None else np.asarray(matrix, dtype=float)
+
+        self.coverage = self.base_coverage.copy()
+        self.variant_scale = np.ones(k)
+        self.manufacturer_scale = np.ones(m)
+        self._efficacy = self.base_efficacy.copy()  # after manufacturer scaling
+        self.values = {measure: np.empty((n, k)) for measure in MEASURES}
+        self._rates(slice(None), slice(None))
+        self.baseline = {measure: values.copy() for measure, values in self.values.items()}
+        self.last_cells = n * k
+
+    @classmethod
+    def from_world(cls, world, df_country_efficacy, doses=None, df_efficacy=None):
+        """Scenario for the countries of ``world`` (needs 'name' and '% People Fully Vaccinated').
+
+        ``doses`` (``dose_rows()``) and the raw efficacy sheet ``df_efficacy``
+        enable per-manufacturer scaling.
+        """
+        variants = variants_of(df_country_efficacy)
+        joined = joins.join_efficacy(world[["name"]], df_country_efficacy, variants)
+        efficacies = joined[[f"{v} Infection Efficacy" for v in variants]].to_numpy()
+        weights = matrix = None
+        manufacturers = ()
+        if doses is not None and df_efficacy is not None:
+            table = efficacy.efficacy_matrix(efficacy.clean_efficacy(df_efficacy))
+            shares = efficacy.dose_weights(doses).rename(index=joins.COUNTRY_ALIASES)
+            manufacturers = [v for v in shares.columns if v in table.index]
+            weights = shares.reindex(index=world["name"], columns=manufacturers, fill_value=0.0).fillna(0.0)
+            matrix = table.loc[manufacturers, [f"{v} Infection" for v in variants]]
+        return cls(world["name"], world["% People Fully Vaccinated"], efficacies, variants,
+                   weights, matrix, manufacturers)
+
+    def _rates(self, rows, cols):
+        """Recompute the measures of the ``rows`` x ``cols`` block (index arrays or slices)."""
+        block = np.ix_(rows, cols) if not isinstance(rows, slice) else (rows, cols)
+        scale = self.variant_scale[cols]
+        effective = np.clip(self._efficacy[block] * scale, 0, 100)
+        coverage = self.coverage[rows][:, None]
+        protection = coverage * effective / 100
+        self.values["Infection Efficacy"][block] = effective
+        self.values["Breakthrough Infection"][block] = 100 - effective
+        self.values["Protection"][block] = protection
+        self.values["Infection"][block] = 100 - protection
+
+    def update(self, coverage=None, variant_scale=None, manufacturer_scale=None):
+        """Move to the scenario given by the arguments; returns the number of cells recomputed.
+
+        ``coverage`` maps country name -> % fully vaccinated, ``variant_scale``
+        variant -> efficacy multiplier, ``manufacturer_scale`` manufacturer ->
+        efficacy multiplier. Anything not mentioned is at its baseline.
+        """
+        target_coverage = self.base_coverage.copy()
+        if coverage:
+            index = pd.Index(self.names)
+            positions = index.get_indexer(list(coverage))
+            known = positions >= 0
+            target_coverage[positions[known]] = np.asarray(list(coverage.values()), dtype=float)[known]
+        target_variants = np.array([(variant_scale or {}).get(v, 1.0) for v in self.variants], dtype=float)
+        target_manufacturers = np.array([(manufacturer_scale or {}).get(m, 1.0) for m in self.manufacturers],
+                                        dtype=float)
+
+        changed_rows = np.zeros(len(self.names), dtype=bool)
+        differs = ~((target_coverage == self.coverage) | (np.isnan(target_coverage) & np.isnan(self.coverage)))
+        changed_rows |= differs
+        self.coverage = target_coverage
+
+        manufacturers = np.flatnonzero(target_manufacturers != self.manufacturer_scale)
+        if len(manufacturers):
+            self.manufacturer_scale = target_manufacturers
+            rows = np.flatnonzero((self.weights[:, manufacturers] != 0).any(axis=1))
+            adjustment = (self.manufacturer_scale - 1)[:, None] * self.matrix
+            self._efficacy[rows] = self.base_efficacy[rows] + self.weights[rows] @ adjustment
+            changed_rows[rows] = True
+
+        changed_cols = target_variants != self.variant_scale
+        self.variant_scale = target_variants
+
+        rows, cols = np.flatnonzero(changed_rows), np.flatnonzero(changed_cols)
+        other_cols = np.flatnonzero(~changed_cols)
+        if len(cols):
+            self._rates(slice(None), cols)
+        if len(rows) and len(other_cols):
+            self._rates(rows, other_cols)
+        self.last_cells = len(self.names) * len(cols) + len(rows) * len(other_cols)
+        return self.last_cells
+
+    def frame(self, variant=None):
+        """Current values as a frame: name, coverage and '<variant> <measure>' columns."""
+        variants = self.variants if variant is None else [variant]
+        columns = {"name": self.names, "% People Fully Vaccinated": self.coverage}
+        for v in variants:
+            j = self.variants.index(v)
+            for measure in MEASURES:
+                columns[f"{v} {measure}"] = self.values[measure][:, j]
+        return pd.DataFrame(columns)
@@ -1,13 +1,8 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
-import geopandas
-import plotly.express as px
-import matplotlib.pyplot as plt
-from PIL import Image
 import streamlit.components.v1 as components
-import plotly.graph_objects as go
-from streamlit_folium import st_folium
+from covid import datasets, images, maps, sections, timing, vaccines
+
+timing.begin("Vaccine Distribution")
 
 
 # st.title("Breakthrough Covid-19 Infection")
@@ -15,12 +10,11 @@ st.title("Vaccine Distribution")
 st.sidebar.markdown("Vaccine Distribution")
 st.markdown('''In this section, we will examine the vaccination dataset and come up with some visuals to understand the vaccine distribution.''')
 
-tb1, tb2, tb3 = st.tabs(
-    ["Vaccination Dataset", "World Dataset", "Vaccine Distribution"])
-with tb1:
+tab = sections.tabs(
+    ["Vaccination Dataset", "World Dataset", "Vaccine Distribution"], key="vaccine_distribution_tab")
+if tab == "Vaccination Dataset":
     # load vaccination data and clean it
-    df_vaccine = pd.read_excel(
-        'data/vaccination-data-WHO-12-28-2022-NO-DETAILS for-vaciinetype-date.xlsx')
+    df_vaccine = datasets.load_vaccinations()
     st.subheader("Vaccination Dataset Manipulation")
     with st.expander("Click here to view the raw vaccination dataset"):
         st.caption("Table 1: Vaccination Dataset")
@@ -42,12 +36,11 @@ with tb1:
                                            'PERSONS_VACCINATED_1PLUS_DOSE', 'PERSONS_FULLY_VACCINATED', 'VACCINES_USED']]
         st.dataframe(df_vaccine_displayed)
 
-with tb2:
+if tab == "World Dataset":
+    import plotly.graph_objects as go
     st.subheader("Combining Vaccination Dataset with World Dataset")
     # load the dataset from geopandas
-    world = geopandas.read_file(
-        geopandas.datasets.get_path('naturalearth_lowres'))
-    world.rename(columns={'iso_a3': 'ISO3'}, inplace=True)
+    world = datasets.load_naturalearth().rename(columns={'iso_a3': 'ISO3'})
     world['gdp_per_cap'] = world.gdp_md_est / world.pop_est
     st.markdown('''
     Instead of using the population data provided my Professor Majumder, we will be using the population data from a dataset found in GeoPandas because
@@ -60,46 +53,16 @@ with tb2:
         st.caption(
             "Source: https://geopandas.org/en/stable/docs/user_guide/mapping.html")
 
-    world["Total_Vaccinations"] = np.nan
-    world['vaccines'] = np.nan
-    world["Persons_Fully_Vaccinated"] = np.nan
-    world["Total_Vaccinations_Per100"] = np.nan
-    world["Persons_Fully_Vaccinated_Per100"] = np.nan
-    world["persons_vaccinated"] = np.nan
-    world["persons_vaccinated_per100"] = np.nan
-
-    for i in range(world.shape[0]):
-        iso_code = world.loc[i]["ISO3"]
-        if iso_code in list(df_vaccine["ISO3"]):
-            world.at[i, "Total_Vaccinations"] = df_vaccine[df_vaccine["ISO3"]
-                                                           == iso_code].iloc[0]["TOTAL_VACCINATIONS"]
-            world.at[i, "vaccines"] = df_vaccine[df_vaccine["ISO3"]
-                                                 == iso_code].iloc[0]["VACCINES_USED"]
-            world.at[i, "Persons_Fully_Vaccinated"] = df_vaccine[df_vaccine["ISO3"]
-                                                                 == iso_code].iloc[0]["PERSONS_FULLY_VACCINATED"]
-            world.at[i, "Total_Vaccinations_Per100"] = df_vaccine[df_vaccine["ISO3"]
-                                                                  == iso_code].iloc[0]["TOTAL_VACCINATIONS_PER100"]
-            world.at[i, "Persons_Fully_Vaccinated_Per100"] = df_vaccine[df_vaccine["ISO3"]
-                                                                        == iso_code].iloc[0]["PERSONS_FULLY_VACCINATED_PER100"]
-            world.at[i, "persons_vaccinated"] = df_vaccine[df_vaccine["ISO3"]
-                                                           == iso_code].iloc[0]["PERSONS_VACCINATED_1PLUS_DOSE"]
-            world.at[i, "persons_vaccinated_per100"] = df_vaccine[df_vaccine["ISO3"]
-                                                                  == iso_code].iloc[0]["PERSONS_VACCINATED_1PLUS_DOSE_PER100"]
+    # the join and the % columns below are built by `python -m covid.etl`
+    world = datasets.load_world_dataset()
     st.markdown('''
     Let us combine Vaccination Dataset and World Dataset by using **inner join**.
     After inner join, we will drop rows with null values in 'Persons_Fully_Vaccinated' column. ''')
-    world = world[(world.pop_est > 0) & (world.name != "Antarctica")]
-    world = world[world.Persons_Fully_Vaccinated.notnull()]
     st.caption("Table 4: Vaccination Dataset and World Dataset Combined")
-    world
+    st.dataframe(world.drop(columns=["% People Fully Vaccinated", "% People Vaccinated"]))
     st.markdown('''
     After that, we can compute (1)'% People Fully Vaccinated' by dividing 'Persons_Fully_Vaccinated' By 'pop_est' and (2)'% People Vaccinated' by
      dividing 'persons_vaccinated' by 'pop_est'. ''')
-    world["% People Fully Vaccinated"] = world['Persons_Fully_Vaccinated'] / \
-        world['pop_est']*100
-    world["% People Vaccinated"] = world['persons_vaccinated'] / \
-        world['pop_est']*100
-    world.to_csv("data/world_dataset.csv")
     world1 = world.sort_values(
         by=["% People Fully Vaccinated", "% People Vaccinated"], ascending=False)
     with st.expander("Click here to view % People Fully Vaccinated and % People Vaccinated with 1 Plus Dose Data"):
@@ -161,74 +124,47 @@ with tb2:
     """)
 
 
-with tb3:
+if tab == "Vaccine Distribution":
+    import plotly.express as px
+    world = datasets.load_world_dataset()
     st.subheader("Vaccination Rates Are Low in Africa")
     st.caption(
         'These maps are no longer being updated. Data is as of December 28, 2022.')
-    tab1, tab2 = st.tabs(
-        ["Geographical Scatter Plot", "Static Maps"])
-    with tab1:
-        fig = px.scatter_geo(world, locations="ISO3", hover_name="name",
-                             hover_data=["pop_est", "Persons_Fully_Vaccinated", "% People Fully Vaccinated",
-                                         "persons_vaccinated", "% People Vaccinated"],
-                             color="% People Fully Vaccinated",
-                             size='pop_est',
-                             projection="natural earth")
-        fig.update_layout(
-            title='% People Fully Vaccinated',
-        )
-        st.plotly_chart(fig, theme=None, use_container_width=True)
+    view = sections.tabs(
+        ["Geographical Scatter Plot", "Static Maps"], key="vaccination_rates_view")
+    if view == "Geographical Scatter Plot":
+        with timing.stage("figure: vaccination rates"):
+            fig = px.scatter_geo(world, locations="ISO3", hover_name="name",
+                                 hover_data=["pop_est", "Persons_Fully_Vaccinated", "% People Fully Vaccinated",
+                                             "persons_vaccinated", "% People Vaccinated"],
+                                 color="% People Fully Vaccinated",
+                                 size='pop_est',
+                                 projection="natural earth")
+            fig.update_layout(
+                title='% People Fully Vaccinated',
+            )
+            st.plotly_chart(fig, theme=None, use_container_width=True)
         st.caption("The size of the bubble gives the information about pop_est: a bigger bubble indicates a larger population. The color of the bubble gives the information of % people fully vaccinated. Hover over the bubble to see vaccination info for each country. ")
 
-    with tab2:
+    if view == "Static Maps":
+        choropleths = images.render(world, [
+            images.choropleth("pop_est", "Population Estimate by Country", 'YlOrRd'),
+            images.choropleth("Total_Vaccinations", "Total Vacccination by Country", "YlOrRd"),
+            images.choropleth("Persons_Fully_Vaccinated",
+                              "Persons Fully Vaccinated by Country", 'YlOrRd'),
+            images.choropleth("gdp_per_cap", "GDP per capita by Country", 'YlOrRd'),
+            images.choropleth("Total_Vaccinations_Per100",
+                              "Total Vacccination Per100 by Country", "YlOrRd"),
+            images.choropleth("Persons_Fully_Vaccinated_Per100",
+                              "Persons Fully Vaccinated Per100 by Country", 'OrRd'),
+        ])
         with st.container():
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                fig, ax = plt.subplots(1, 1)
-                world.plot(column="pop_est", legend=True, ax=ax,
-                           legend_kwds={'label': "Population Estimate by Country",
-                                        'orientation': "horizontal"}, cmap='YlOrRd')
-                ax.set_axis_off()
-                st.pyplot(fig)
-            with col2:
-                fig, ax = plt.subplots(1, 1)
-                world.plot(column="Total_Vaccinations", ax=ax, legend=True,
-                           legend_kwds={'label': "Total Vacccination by Country",
-                                        'orientation': "horizontal"}, cmap="YlOrRd")
-                ax.set_axis_off()
-                st.pyplot(fig)
-            with col3:
-                fig, ax = plt.subplots(1, 1)
-                world.plot(column="Persons_Fully_Vaccinated", legend=True, ax=ax,
-                           legend_kwds={'label': "Persons Fully Vaccinated by Country",
-                                        'orientation': "horizontal"}, cmap='YlOrRd')
-                ax.set_axis_off()
-                st.pyplot(fig)
-
-            col4, col5, col6 = st.columns(3)
-            with col4:
-                fig, ax = plt.subplots(1, 1)
-                world.plot(column="gdp_per_cap", legend=True, ax=ax,
-                           legend_kwds={'label': "GDP per capita by Country",
-                                        'orientation': "horizontal"}, cmap='YlOrRd')
-                ax.set_axis_off()
-                st.pyplot(fig)
-            with col5:
-                fig, ax = plt.subplots(1, 1)
-                world.plot(column="Total_Vaccinations_Per100", ax=ax, legend=True,
-                           legend_kwds={'label': "Total Vacccination Per100 by Country",
-                                        'orientation': "horizontal"}, cmap="YlOrRd")
-                ax.set_axis_off()
-                st.pyplot(fig)
-            with col6:
-                fig, ax = plt.subplots(1, 1)
-                world.plot(column="Persons_Fully_Vaccinated_Per100", legend=True, ax=ax,
-                           legend_kwds={'label': "Persons Fully Vaccinated Per100 by Country",
-                                        'orientation': "horizontal"}, cmap='OrRd')
-                ax.set_axis_off()
-                st.pyplot(fig)
-    with st.expander("Click here to see the interative folium map"):
-        m = world.explore(
+            for row in (choropleths[:3], choropleths[3:]):
+                for col, png in zip(st.columns(3), row):
+                    col.image(png, use_column_width='always')
+    if st.checkbox("Click here to see the interative folium map", key="vaccination_rates_map"):
+        m = maps.explore_html(
+            world, zoom=2,
             column="% People Fully Vaccinated",
             legend=True,  # show legend
             tooltip=["name"],  # show value in tooltip (on hover)
@@ -236,7 +172,7 @@ with tb3:
                    "persons_vaccinated", "% People Vaccinated"],  # show all values in popup (on click)
         )
     # m.save("iframe/Vaccine_Dist_PPL_Vacc.html")
-        st_folium(m)
+        components.html(m, height=700)
     st.write(
         "**Food for thought**: Why do Covid-19 vaccination rates remain low in most countries in Africa?")
 
@@ -244,172 +180,45 @@ with tb3:
     st.caption(
         'These maps are no longer being updated. Data is as of December 28, 2022.')
 
-    def contains_vaccine_specific(s, vac):
-        if type(s) == float:
-            return 0
-        else:
-            if vac in s:
-                return 1  # 1 means yes and 0 means no
-            else:
-                return 0
-
     vaccines_of_interest = ['AstraZeneca', 'Pfizer', 'Moderna',
                             'BBIBP', 'Gamaleya', 'Sinovac', 'Janssen', 'Bharat', 'Novavax']
-    for i in vaccines_of_interest:
-        world[i] = world["vaccines"].apply(
-            lambda x: contains_vaccine_specific(x, i))
-    df_AstraZeneca1 = world[world["AstraZeneca"] == 1]
-    df_Pfizer1 = world[world["Pfizer"] == 1]
-    df_Moderna1 = world[world["Moderna"] == 1]
-    df_BBIBP1 = world[world["BBIBP"] == 1]
-    df_Gamaleya1 = world[world["Gamaleya"] == 1]
-    df_Sinovac1 = world[world["Sinovac"] == 1]
-    df_JJ1 = world[world["Janssen"] == 1]
-    df_Bharat1 = world[world["Bharat"] == 1]
-    df_Novavax1 = world[world["Novavax"] == 1]
-    df_AstraZeneca1 = df_AstraZeneca1[['pop_est', 'continent', 'name', 'ISO3', 'gdp_md_est', 'geometry',
-                                       'vaccines', 'Total_Vaccinations', 'Persons_Fully_Vaccinated', "Persons_Fully_Vaccinated_Per100", "persons_vaccinated_per100"]]
-    df_AstraZeneca1["vaccine"] = "AstraZeneca"
-
-    df_Pfizer1 = df_Pfizer1[['pop_est', 'continent', 'name', 'ISO3', 'gdp_md_est', 'geometry',
-                            'vaccines', 'Total_Vaccinations', 'Persons_Fully_Vaccinated', "Persons_Fully_Vaccinated_Per100", "persons_vaccinated_per100"]]
-    df_Pfizer1["vaccine"] = "Pfizer"
-
-    df_Moderna1 = df_Moderna1[['pop_est', 'continent', 'name', 'ISO3', 'gdp_md_est', 'geometry',
-                               'vaccines', 'Total_Vaccinations', 'Persons_Fully_Vaccinated', "Persons_Fully_Vaccinated_Per100", "persons_vaccinated_per100"]]
-    df_Moderna1["vaccine"] = "Moderna"
-
-    df_BBIBP1 = df_BBIBP1[['pop_est', 'continent', 'name', 'ISO3', 'gdp_md_est', 'geometry',
-                           'vaccines', 'Total_Vaccinations', 'Persons_Fully_Vaccinated', "Persons_Fully_Vaccinated_Per100", "persons_vaccinated_per100"]]
-    df_BBIBP1["vaccine"] = "BBIBP"
-
-    df_Gamaleya1 = df_Gamaleya1[['pop_est', 'continent', 'name', 'ISO3', 'gdp_md_est', 'geometry',
-                                'vaccines', 'Total_Vaccinations', 'Persons_Fully_Vaccinated', "Persons_Fully_Vaccinated_Per100", "persons_vaccinated_per100"]]
-    df_Gamaleya1["vaccine"] = "Gamaleya"
-
-    df_Sinovac1 = df_Sinovac1[['pop_est', 'continent', 'name', 'ISO3', 'gdp_md_est', 'geometry',
-                               'vaccines', 'Total_Vaccinations', 'Persons_Fully_Vaccinated', "Persons_Fully_Vaccinated_Per100", "persons_vaccinated_per100"]]
-    df_Sinovac1["vaccine"] = "Sinovac"
-
-    df_JJ1 = df_JJ1[['pop_est', 'continent', 'name', 'ISO3', 'gdp_md_est', 'geometry',
-                    'vaccines', 'Total_Vaccinations', 'Persons_Fully_Vaccinated', "Persons_Fully_Vaccinated_Per100", "persons_vaccinated_per100"]]
-    df_JJ1["vaccine"] = "Johnson & Johnson"
-
-    df_Bharat1 = df_Bharat1[['pop_est', 'continent', 'name', 'ISO3', 'gdp_md_est', 'geometry',
-                            'vaccines', 'Total_Vaccinations', 'Persons_Fully_Vaccinated', "Persons_Fully_Vaccinated_Per100", "persons_vaccinated_per100"]]
-    df_Bharat1["vaccine"] = "Bharat"
-
-    df_Novavax1 = df_Novavax1[['pop_est', 'continent', 'name', 'ISO3', 'gdp_md_est', 'geometry',
-                               'vaccines', 'Total_Vaccinations', 'Persons_Fully_Vaccinated', "Persons_Fully_Vaccinated_Per100", "persons_vaccinated_per100"]]
-    df_Novavax1["vaccine"] = "Novavax"
-    df = pd.concat([df_AstraZeneca1, df_Pfizer1, df_Moderna1, df_BBIBP1,
-                    df_Gamaleya1, df_Sinovac1, df_JJ1, df_Bharat1, df_Novavax1], axis=0)
+    vaccine_labels = {"Janssen": "Johnson & Johnson"}
+
+    world_digest = datasets.source_digest(datasets.WORLD_DATASET_CSV)
+    used = datasets.derived("vaccine_use", lambda: vaccines.usage(world["vaccines"]), world_digest)
+    df = datasets.derived(
+        "vaccine_use_long",
+        lambda: vaccines.long_form(world, used, vaccines_of_interest,
+                                   ['pop_est', 'continent', 'name', 'ISO3', 'gdp_md_est', 'vaccines', 'Total_Vaccinations',
+                                    'Persons_Fully_Vaccinated', "Persons_Fully_Vaccinated_Per100", "persons_vaccinated_per100"],
+                                   labels=vaccine_labels),
+        world_digest)
     with st.container():
-        tab1, tab2 = st.tabs(["Interactive Maps", "Static Maps"])
-        with tab1:
-            fig = px.scatter_geo(df, locations="ISO3",
-                                 color="vaccine",
-                                 hover_name="name",
-                                 hover_data=[
-                                     'name', 'pop_est', "Persons_Fully_Vaccinated_Per100", "persons_vaccinated_per100"],
-                                 #                    size='Total_Vaccinations',
-                                 animation_frame="vaccine",
-                                 projection="natural earth")
-            fig.update_layout(title="Vaccine Distribution",
-                              #                   height=500, margin={"r":0,"t":0,"l":0,"b":0},
-                              )
-            st.plotly_chart(fig, theme="streamlit", use_container_width=True)
-        with tab2:
-            c1, c2, c3 = st.columns(3)
-            with c1:
-                ax = world.plot(color='lightgrey')
-                ax.set_aspect('equal')
-                ax.set_axis_off()
-                ax.set_title("AstraZeneca")
-                df_AstraZeneca1.plot(ax=ax, color="darkorange")
-                plt.savefig('iframe/AstraZeneca.png')
-                image1 = Image.open('iframe/AstraZeneca.png')
-                st.image(image1, use_column_width='always',
-                         caption="112 countries")
-            with c2:
-                ax = world.plot(color='lightgrey')
-                ax.set_aspect('equal')
-                ax.set_axis_off()
-                ax.set_title("Pfizer")
-                df_Pfizer1.plot(ax=ax, color="darkblue")
-                plt.savefig('iframe/Pfizer.png')
-                image1 = Image.open('iframe/Pfizer.png')
-                st.image(image1, use_column_width='always',
-                         caption="126 countries")
-            with c3:
-                ax = world.plot(color='lightgrey')
-                ax.set_aspect('equal')
-                ax.set_axis_off()
-                ax.set_title("Moderna")
-                df_Moderna1.plot(ax=ax, color="green")
-                plt.savefig('iframe/Moderna.png')
-                image1 = Image.open('iframe/Moderna.png')
-                st.image(image1, use_column_width='always',
-                         caption="100 countries")
-            c4, c5, c6 = st.columns(3)
-            with c4:
-                ax = world.plot(color='lightgrey')
-                ax.set_aspect('equal')
-                ax.set_axis_off()
-                ax.set_title("BBIBP")
-                df_BBIBP1.plot(ax=ax, color="red")
-                plt.savefig('iframe/BBIBP.png')
-                image1 = Image.open('iframe/BBIBP.png')
-                st.image(image1, use_column_width='always',
-                         caption="88 countries")
-            with c5:
-                ax = world.plot(color='lightgrey')
-                ax.set_aspect('equal')
-                ax.set_axis_off()
-                ax.set_title("Gamaleya")
-                df_Gamaleya1.plot(ax=ax, color="gold")
-                plt.savefig('iframe/Gamaleya.png')
-                image1 = Image.open('iframe/Gamaleya.png')
-                st.image(image1, use_column_width='always',
-                         caption="64 countries")
-            with c6:
-                ax = world.plot(color='lightgrey')
-                ax.set_aspect('equal')
-                ax.set_axis_off()
-                ax.set_title("Sinovac")
-                df_Sinovac1.plot(ax=ax, color="deeppink")
-                plt.savefig('iframe/Sinovac.png')
-                image1 = Image.open('iframe/Sinovac.png')
-                st.image(image1, use_column_width='always',
-                         caption="62 countries")
-            c7, c8, c9 = st.columns(3)
-            with c7:
-                ax = world.plot(color='lightgrey')
-                ax.set_aspect('equal')
-                ax.set_axis_off()
-                ax.set_title("Johnson & Johnson")
-                df_JJ1.plot(ax=ax, color="purple")
-                plt.savefig('iframe/JJ.png')
-                image1 = Image.open('iframe/JJ.png')
-                st.image(image1, use_column_width='always',
-                         caption="103 countries")
-            with c8:
-                ax = world.plot(color='lightgrey')
-                ax.set_aspect('equal')
-                ax.set_axis_off()
-                ax.set_title("Bharat")
-                df_Bharat1.plot(ax=ax, color="mediumturquoise")
-                plt.savefig('iframe/Bharat.png')
-                image1 = Image.open('iframe/Bharat.png')
-                st.image(image1, use_column_width='always',
-                         caption="30 countries")
-            with c9:
-                ax = world.plot(color='lightgrey')
-                ax.set_aspect('equal')
-                ax.set_axis_off()
-                ax.set_title("Novavax")
-                df_Novavax1.plot(ax=ax, color="dodgerblue")
-                plt.savefig('iframe/Novavax.png')
-                image1 = Image.open('iframe/Novavax.png')
-                st.image(image1, use_column_width='always',
-                         caption="28 countries")
+        view = sections.tabs(["Interactive Maps", "Static Maps"], key="vaccine_distribution_view")
+        if view == "Interactive Maps":
+            with timing.stage("figure: vaccine distribution"):
+                fig = px.scatter_geo(df, locations="ISO3",
+                                     color="vaccine",
+                                     hover_name="name",
+                                     hover_data=[
+                                         'name', 'pop_est', "Persons_Fully_Vaccinated_Per100", "persons_vaccinated_per100"],
+                                     #                    size='Total_Vaccinations',
+                                     animation_frame="vaccine",
+                                     projection="natural earth")
+                fig.update_layout(title="Vaccine Distribution",
+                                  #                   height=500, margin={"r":0,"t":0,"l":0,"b":0},
+                                  )
+                st.plotly_chart(fig, theme="streamlit", use_container_width=True)
+        if view == "Static Maps":
+            colors = ["darkorange", "darkblue", "green", "red", "gold", "deeppink", "purple",
+                      "mediumturquoise", "dodgerblue"]
+            overlays = images.render(world, [
+                images.overlay(used.index[used[v]], vaccine_labels.get(v, v), color)
+                for v, color in zip(vaccines_of_interest, colors)])
+            counts = used[vaccines_of_interest].sum()
+            for row in range(0, 9, 3):
+                for col, png, v in zip(st.columns(3), overlays[row:row + 3],
+                                       vaccines_of_interest[row:row + 3]):
+                    col.image(png, use_column_width='always', caption=f"{counts[v]} countries")
+
+timing.report()
@@ -1,11 +1,8 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
-import geopandas
-import plotly.express as px
-import plotly.graph_objects as go
-from streamlit_folium import st_folium
-from plotly.subplots import make_subplots
+import streamlit.components.v1 as components
+from covid import breakthrough, datasets, joins, maps, sections, timing
+
+timing.begin("Breakthrough Infection")
 
 st.header("Breakthrough COVID-19 Infection")
 st.sidebar.markdown("Breakthrough Infection")
@@ -13,34 +10,36 @@ st.markdown("""Previously, we have computed (1)**% People Fully Vaccinated** and
 In this section, we are going to compute the breakthrough infection and visualize breakthrough infection.""")
 
 
-tab1, tab2, tab3 = st.tabs(
-    ["Datasets Combination", "Compute Breakthrough Infection", "Visualize Breakthrough Infection"])
-with tab1:
+tab = sections.tabs(
+    ["Datasets Combination", "Compute Breakthrough Infection", "Visualize Breakthrough Infection",
+     "What-if Scenarios"],
+    key="breakthrough_tab")
+df_temp = datasets.load_country_efficacy()
+df_temp = df_temp[['country', 'Alpha Infection',
+                   'Delta Infection', 'Omicron Infection']]
+
+
+# countries with their share of people vaccinated, built by `python -m covid.etl`
+world_sources = (datasets.source_digest(datasets.WORLD_COVERAGE_PARQUET),
+                 datasets.source_digest(datasets.COUNTRY_EFFICACY_CSV))
+world = datasets.derived(
+    "efficacy_world", lambda: joins.join_efficacy(datasets.load_world_coverage(), df_temp), *world_sources)
+
+
+def world_rates():
+    """``world`` with the Breakthrough Infection, Protection and Infection columns, once per process."""
+    return datasets.derived("breakthrough_world", lambda: breakthrough.add_rates(world), *world_sources)
+
+if tab == "Datasets Combination":
     st.subheader("Datasets Combination")
-    df_test = pd.read_csv("data/world_dataset.csv")
+    df_test = datasets.load_world_dataset()
     df_test = df_test[['pop_est', 'continent', 'name', 'ISO3', 'gdp_md_est',
                        'geometry', 'gdp_per_cap', '% People Fully Vaccinated',
                        '% People Vaccinated']]
-    df_test["Alpha Infection Efficacy"] = np.nan
-    df_test["Delta Infection Efficacy"] = np.nan
-    df_test["Omicron Infection Efficacy"] = np.nan
 
     st.markdown("""**First**, we will combine the world dataset with the average vaccine efficacy dataset using **left join**. Left join will make sure that we can keep all the data in the world dataset.""")
-    df_temp = pd.read_csv("data/country_efficacy.csv")
-    df_temp = df_temp[['country', 'Alpha Infection',
-                       'Delta Infection', 'Omicron Infection']]
-    df_temp.loc[1, ['country']] = "United States of America"
-    country_efficacy = list(df_temp.country)
     with st.expander("Clicked here to view combined dataset"):
-        for i in range(df_test.shape[0]):
-            country = df_test.loc[i]["name"]
-            if country in country_efficacy:
-                df_test.at[i, "Alpha Infection Efficacy"] = df_temp[df_temp["country"]
-                                                                    == country]["Alpha Infection"].values[0]
-                df_test.at[i, "Delta Infection Efficacy"] = df_temp[df_temp["country"]
-                                                                    == country]["Delta Infection"].values[0]
-                df_test.at[i, "Omicron Infection Efficacy"] = df_temp[df_temp["country"]
-                                                                      == country]["Omicron Infection"].values[0]
+        df_test = joins.join_efficacy(df_test, df_temp)
         df_test = df_test[df_test["name"] != "Eritrea"]
         st.dataframe(df_test)
     st.markdown("""
@@ -52,88 +51,49 @@ with tab1:
     st.write(
         "Therefore, we do not have average vaccine efficacy data for a lot of countries.")
 
-    world = geopandas.read_file(
-        geopandas.datasets.get_path('naturalearth_lowres'))
-    world.rename(columns={'iso_a3': 'ISO3'}, inplace=True)
-    world['gdp_per_cap'] = world.gdp_md_est / world.pop_est
-    world["Persons_Fully_Vaccinated"] = np.nan
-    world["persons_vaccinated"] = np.nan
-    df_vaccine = pd.read_excel(
-        'data/vaccination-data-WHO-12-28-2022-NO-DETAILS for-vaciinetype-date.xlsx')
-    df_vaccine = df_vaccine[df_vaccine["COUNTRY"] != "Eritrea"]
-    for i in range(world.shape[0]):
-        iso_code = world.loc[i]["ISO3"]
-        if iso_code in list(df_vaccine["ISO3"]):
-            world.at[i, "Persons_Fully_Vaccinated"] = df_vaccine[df_vaccine["ISO3"]
-                                                                 == iso_code].iloc[0]["PERSONS_FULLY_VACCINATED"]
-            world.at[i, "persons_vaccinated"] = df_vaccine[df_vaccine["ISO3"]
-                                                           == iso_code].iloc[0]["PERSONS_VACCINATED_1PLUS_DOSE"]
-    world = world[(world.pop_est > 0) & (world.name != "Antarctica")]
-    # world.dropna(inplace=True)
-    world["% People Fully Vaccinated"] = world['Persons_Fully_Vaccinated'] / \
-        world['pop_est']*100
-    world["% People Vaccinated"] = world['persons_vaccinated'] / \
-        world['pop_est']*100
-    world.index = range(len(world))
-    for i in range(world.shape[0]):
-        country = world.loc[i]["name"]
-        if country in country_efficacy:
-            world.at[i, "Alpha Infection Efficacy"] = df_temp[df_temp["country"]
-                                                              == country]["Alpha Infection"].values[0]
-            world.at[i, "Delta Infection Efficacy"] = df_temp[df_temp["country"]
-                                                              == country]["Delta Infection"].values[0]
-            world.at[i, "Omicron Infection Efficacy"] = df_temp[df_temp["country"]
-                                                                == country]["Omicron Infection"].values[0]
-
-    with st.expander("Click here to visualize the distribution for average vaccine efficacy"):
+    if st.checkbox("Click here to visualize the distribution for average vaccine efficacy",
+                   key="efficacy_map"):
         option = st.selectbox(
             'Select the average vaccine efficacy data for one variant:',
-            ("Alpha Infection Efficacy", "Delta Infection Efficacy", "Omicron Infection Efficacy"))
+            ("Alpha Infection Efficacy", "Delta Infection Efficacy", "Omicron Infection Efficacy"),
+            key="efficacy_map_variant")
         st.write("You will be visualizing the distribution for", option, '.')
         if option == "Alpha Infection Efficacy":
-            st_folium(world.explore(column="Alpha Infection Efficacy",
-                                    cmap="YlGn",
-                                    tiles="CartoDB positron",
-                                    tooltip='name',
-                                    popup=['name', 'pop_est', '% People Fully Vaccinated', "Alpha Infection Efficacy", "Delta Infection Efficacy", "Omicron Infection Efficacy"]))
+            m1 = maps.explore_html(world, zoom=2, column="Alpha Infection Efficacy",
+                                   cmap="YlGn",
+                                   tiles="CartoDB positron",
+                                   tooltip='name',
+                                   popup=['name', 'pop_est', '% People Fully Vaccinated', "Alpha Infection Efficacy", "Delta Infection Efficacy", "Omicron Infection Efficacy"])
+            components.html(m1, height=700)
         elif option == "Delta Infection Efficacy":
-            m1 = world.explore(column="Delta Infection Efficacy",
-                               cmap="YlGn",
-                               tiles="CartoDB positron",
-                               tooltip='name',
-                               popup=['name', 'pop_est', '% People Fully Vaccinated', "Alpha Infection Efficacy", "Delta Infection Efficacy", "Omicron Infection Efficacy"])
-            st_folium(m1)
+            m1 = maps.explore_html(world, zoom=2, column="Delta Infection Efficacy",
+                                   cmap="YlGn",
+                                   tiles="CartoDB positron",
+                                   tooltip='name',
+                                   popup=['name', 'pop_est', '% People Fully Vaccinated', "Alpha Infection Efficacy", "Delta Infection Efficacy", "Omicron Infection Efficacy"])
+            components.html(m1, height=700)
         else:
-            st_folium(world.explore(column="Omicron Infection Efficacy",
-                                    cmap="YlGn",
-                                    tiles="CartoDB positron",
-                                    tooltip='name',
-                                    popup=['name', 'pop_est', '% People Fully Vaccinated', "Alpha Infection Efficacy", "Delta Infection Efficacy", "Omicron Infection Efficacy"]))
+            m1 = maps.explore_html(world, zoom=2, column="Omicron Infection Efficacy",
+                                   cmap="YlGn",
+                                   tiles="CartoDB positron",
+                                   tooltip='name',
+                                   popup=['name', 'pop_est', '% People Fully Vaccinated', "Alpha Infection Efficacy", "Delta Infection Efficacy", "Omicron Infection Efficacy"])
+            components.html(m1, height=700)
 
 
-with tab2:
+if tab == "Compute Breakthrough Infection":
     st.subheader("Compute Breakthrough Infection")
+    # the columns each step below describes, computed by breakthrough.add_rates
+    rated = world_rates()
     st.markdown("""**Second**, we will compute the **Breakthrough Infection** by subtracting **'Infection Efficacy'** from 1. 
     Infection Efficacy gives us a vaccine's efficacy at stopping transmission of the virus from one person to another. By definition, 1-'Infection Efficacy' will give us the Breakthrough Infection, which is % vaccinated people who get COVID-19 after exposed to the the SARS-CoV-2 virus.
     """)
-    world["Alpha Breakthrough Infection"] = 100 - \
-        world['Alpha Infection Efficacy']
-    world["Delta Breakthrough Infection"] = 100 - \
-        world['Delta Infection Efficacy']
-    world['Omicron Breakthrough Infection'] = 100 - \
-        world['Omicron Infection Efficacy']
 
     st.markdown("""
     **Third**, we will multiply **'% People Fully Vaccinated'** with **'Infection Efficacy'**.
     - Multiplying '% People Fully Vaccinated' with 'Alpha Infection Efficacy' will result in **'Alpha Protection'**, which gives us an idea of % people that are protected from Alpha Infection because they are fully vacinnated.
     - Multiplying '% People Fully Vaccinated' with 'Delta Infection Efficacy' will give 'Delta Protection'.
     - Multiplying '% People Fully Vaccinated' with 'Omicron Infection Efficacy' will give 'Omicron Protection'.""")
-    world["Alpha Protection"] = world["% People Fully Vaccinated"] * \
-        world['Alpha Infection Efficacy']/100
-    world['Delta Protection'] = world["% People Fully Vaccinated"] * \
-        world['Delta Infection Efficacy']/100
-    world["Omicron Protection"] = world["% People Fully Vaccinated"] * \
-        world["Omicron Infection Efficacy"]/100
 
     st.markdown("""
     **Fourth**, we can compute the **infection rate** by adding up unvaccinated people and breakthrough infection:
@@ -146,19 +106,16 @@ with tab2:
     2. 100-'Delta Protection' will give 'Delta Breakthrough Infection'.
     3. 100-'Omicron Protection' will give 'Omicron Breakthrough Infection'.
     """)
-    world["Alpha Infection"] = 100-world['Alpha Protection']
-    world["Delta Infection"] = 100-world['Delta Protection']
-    world['Omicron Infection'] = 100-world['Omicron Protection']
 
     with st.expander("Click here to see the raw breakthrough infection data"):
         st.caption("Table 1: Breakthrough Infection Dataset")
-        st.dataframe(world[['name', 'pop_est', '% People Fully Vaccinated',
+        st.dataframe(rated[['name', 'pop_est', '% People Fully Vaccinated',
                             "Alpha Breakthrough Infection", "Delta Breakthrough Infection", 'Omicron Breakthrough Infection',
                             "Alpha Protection", 'Delta Protection', 'Omicron Protection',
                             "Alpha Infection", "Delta Infection", 'Omicron Infection'
                             ]])
 
-    world_notnull = world[world['Omicron Protection'].notnull()][['name', 'pop_est', '% People Fully Vaccinated', '% People Vaccinated',
+    world_notnull = rated[rated['Omicron Protection'].notnull()][['name', 'pop_est', '% People Fully Vaccinated', '% People Vaccinated',
                                                                   "Alpha Protection", 'Delta Protection', 'Omicron Protection',
                                                                   "Alpha Breakthrough Infection", "Delta Breakthrough Infection", 'Omicron Breakthrough Infection',
                                                                   "Alpha Infection", "Delta Infection", 'Omicron Infection'
@@ -167,7 +124,9 @@ with tab2:
     st.dataframe(world_notnull)
 
 
-with tab3:
+if tab == "Visualize Breakthrough Infection":
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
     st.subheader("Visualize Breakthrough Infection")
     # world_notnull1 = world_notnull.sort_values(
     #     by=["% People Fully Vaccinated"])
@@ -177,45 +136,154 @@ with tab3:
     # fig1.update_layout(title="% People Fully Vaccinated")
     # st.plotly_chart(fig1)
 
+    world_notnull = world_rates()
+    world_notnull = world_notnull[world_notnull['Omicron Protection'].notnull()]
     world_notnull = world_notnull.sort_values(
         by=['Alpha Breakthrough Infection'])
 
     selected_countries = st.multiselect(
         'Add country', list(world_notnull.name),
-        ['Canada', 'United States of America', 'Ukraine', 'South Africa',])
+        ['Canada', 'United States of America', 'Ukraine', 'South Africa',],
+        key="breakthrough_countries")
     world_display1 = world_notnull[world_notnull['name'].isin(
         selected_countries)]
-    fig = make_subplots(rows=1, cols=2, shared_yaxes=True,
-                        subplot_titles=("% People Vaccinated", "Protection %")
-                        )
-    fig.append_trace(go.Bar(name="with 1 Plus Dose", y=world_display1.name, x=world_display1["% People Vaccinated"],
-                            legendgrouptitle_text="% People Vaccinated", legendgroup="group", orientation='h'), 1, 1)
-    fig.append_trace(go.Bar(name="Fully Vaccinated", y=world_display1.name, x=world_display1['% People Fully Vaccinated'],
-                            orientation='h'), 1, 1)
-
-    fig.append_trace(go.Bar(name="Omicron", y=world_display1.name, x=world_display1["Omicron Protection"],
-                            legendgrouptitle_text="Protection %", legendgroup="group2", orientation='h'), 1, 2)
-    fig.append_trace(go.Bar(name="Delta", y=world_display1.name,
-                     x=world_display1["Delta Protection"], orientation='h'), 1, 2)
-    fig.append_trace(go.Bar(name="Alpha", y=world_display1.name,
-                     x=world_display1["Alpha Protection"], orientation='h'), 1, 2)
-    st.plotly_chart(fig)
-    fig1 = go.Figure()
-    fig1 = make_subplots(rows=1, cols=2, shared_yaxes=True,
-                         subplot_titles=(
-                             "Breakthrough Infection %", "Infection %")
-                         )
-    fig1.append_trace(go.Bar(name="Alpha", y=world_display1.name, x=world_display1["Alpha Breakthrough Infection"],
-                             legendgrouptitle_text="Breakthrough Infection %", legendgroup="group", orientation='h'), 1, 1)
-    fig1.append_trace(go.Bar(name="Delta", y=world_display1.name, x=world_display1["Delta Breakthrough Infection"],
-                             orientation='h'), 1, 1)
-    fig1.append_trace(go.Bar(name="Omicron", y=world_display1.name, x=world_display1["Omicron Breakthrough Infection"],
-                             orientation='h'), 1, 1)
-
-    fig1.append_trace(go.Bar(name="Alpha", y=world_display1.name, x=world_display1["Alpha Infection"],
-                             legendgrouptitle_text="Infection %", legendgroup="group2", orientation='h'), 1, 2)
-    fig1.append_trace(go.Bar(name="Delta", y=world_display1.name, x=world_display1["Delta Infection"],
-                             orientation='h'), 1, 2)
-    fig1.append_trace(go.Bar(name="Omicron", y=world_display1.name, x=world_display1["Omicron Infection"],
-                             orientation='h'), 1, 2)
-    st.plotly_chart(fig1)
+    show_bands = st.checkbox("Show 95% uncertainty bands", key="breakthrough_bands")
+    if show_bands:
+        from covid import uncertainty
+        bands = uncertainty.load_bands(world).set_index("name").loc[world_display1.name]
+        st.caption(f"From {uncertainty.SAMPLES} samples, drawing each manufacturer's efficacy with a standard deviation of "
+                   f"{uncertainty.EFFICACY_SD:g} points and coverage with one of {uncertainty.COVERAGE_SD:.0%}.")
+
+    def band(column):
+        """Error bars from the 2.5th to the 97.5th percentile of ``column``, when shown."""
+        if not show_bands:
+            return None
+        value = world_display1[column].to_numpy()
+        return dict(type="data", symmetric=False, array=bands[f"{column} high"].to_numpy() - value,
+                    arrayminus=value - bands[f"{column} low"].to_numpy())
+    with timing.stage("figure: protection"):
+        fig = make_subplots(rows=1, cols=2, shared_yaxes=True,
+                            subplot_titles=("% People Vaccinated", "Protection %")
+                            )
+        fig.append_trace(go.Bar(name="with 1 Plus Dose", y=world_display1.name, x=world_display1["% People Vaccinated"],
+                                legendgrouptitle_text="% People Vaccinated", legendgroup="group", orientation='h'), 1, 1)
+        fig.append_trace(go.Bar(name="Fully Vaccinated", y=world_display1.name, x=world_display1['% People Fully Vaccinated'],
+                                orientation='h'), 1, 1)
+
+        fig.append_trace(go.Bar(name="Omicron", y=world_display1.name, x=world_display1["Omicron Protection"], error_x=band("Omicron Protection"),
+                                legendgrouptitle_text="Protection %", legendgroup="group2", orientation='h'), 1, 2)
+        fig.append_trace(go.Bar(name="Delta", y=world_display1.name,
+                         x=world_display1["Delta Protection"], error_x=band("Delta Protection"), orientation='h'), 1, 2)
+        fig.append_trace(go.Bar(name="Alpha", y=world_display1.name,
+                         x=world_display1["Alpha Protection"], error_x=band("Alpha Protection"), orientation='h'), 1, 2)
+        st.plotly_chart(fig)
+    with timing.stage("figure: breakthrough infection"):
+        fig1 = go.Figure()
+        fig1 = make_subplots(rows=1, cols=2, shared_yaxes=True,
+                             subplot_titles=(
+                                 "Breakthrough Infection %", "Infection %")
+                             )
+        fig1.append_trace(go.Bar(name="Alpha", y=world_display1.name, x=world_display1["Alpha Breakthrough Infection"],
+                                 legendgrouptitle_text="Breakthrough Infection %", legendgroup="group", orientation='h'), 1, 1)
+        fig1.append_trace(go.Bar(name="Delta", y=world_display1.name, x=world_display1["Delta Breakthrough Infection"],
+                                 orientation='h'), 1, 1)
+        fig1.append_trace(go.Bar(name="Omicron", y=world_display1.name, x=world_display1["Omicron Breakthrough Infection"],
+                                 orientation='h'), 1, 1)
+
+        fig1.append_trace(go.Bar(name="Alpha", y=world_display1.name, x=world_display1["Alpha Infection"], error_x=band("Alpha Infection"),
+                                 legendgrouptitle_text="Infection %", legendgroup="group2", orientation='h'), 1, 2)
+        fig1.append_trace(go.Bar(name="Delta", y=world_display1.name, x=world_display1["Delta Infection"], error_x=band("Delta Infection"),
+                                 orientation='h'), 1, 2)
+        fig1.append_trace(go.Bar(name="Omicron", y=world_display1.name, x=world_display1["Omicron Infection"], error_x=band("Omicron Infection"),
+                                 orientation='h'), 1, 2)
+        st.plotly_chart(fig1)
+
+if tab == "What-if Scenarios":
+    import time
+    import numpy as np
+    import plotly.graph_objects as go
+    from covid import whatif
+    st.subheader("What-if Scenarios")
+    st.markdown("""What if vaccines protected better or worse against a variant, one manufacturer's vaccine worked better or worse than reported, or more people in a country were fully vaccinated?
+    Move the sliders to see how **Protection** and **Infection** would change. Only the countries and variants a slider affects are recomputed.""")
+
+    dose_source = whatif.dose_source()
+    # one scenario per session, updated in place on every rerun
+    scenario = sections.session_cached(
+        "whatif_scenario",
+        lambda: whatif.Scenario.from_world(world, datasets.load_country_efficacy(), whatif.dose_rows(),
+                                           datasets.load_efficacy()),
+        datasets.source_digest(datasets.WORLD_COVERAGE_PARQUET),
+        datasets.source_digest(datasets.COUNTRY_EFFICACY_CSV),
+        datasets.source_digest(datasets.EFFICACY_XLSX),
+        dose_source and datasets.source_digest(dose_source))
+
+    def reset_scenario():
+        for key in [k for k in st.session_state if str(k).startswith("whatif_")]:
+            del st.session_state[key]
+
+    def remember_coverage(country, key):
+        st.session_state.setdefault("whatif_coverage", {})[country] = st.session_state[key]
+
+    st.button("Reset to reported values", on_click=reset_scenario)
+    with st.expander("Efficacy per variant", expanded=True):
+        variant_scale = {v: st.slider(f"{v}: % of reported efficacy", 0, 150, 100, 5,
+                                      key=f"whatif_variant_{v}") / 100
+                         for v in scenario.variants}
+    with st.expander("Efficacy per manufacturer"):
+        manufacturer_scale = {m: st.slider(f"{m}: % of reported efficacy", 0, 150, 100, 5,
+                                           key=f"whatif_manufacturer_{m}") / 100
+                              for m in scenario.manufacturers}
+        if not scenario.manufacturers:
+            st.caption("This needs the doses by manufacturer: the manufacturer sheet, or the OWID feed cached by the Dashboard.")
+    with st.expander("Coverage per country"):
+        coverage = st.session_state.setdefault("whatif_coverage", {})
+        country = st.selectbox("Country", list(scenario.names), key="whatif_country")
+        reported = scenario.base_coverage[list(scenario.names).index(country)]
+        if np.isnan(reported):
+            st.caption("There is no vaccination data for this country.")
+        else:
+            key = f"whatif_coverage_{country}"
+            st.slider("% People Fully Vaccinated", 0.0, float(max(100, np.ceil(reported))),
+                      float(coverage.get(country, reported)), 0.5, key=key,
+                      on_change=remember_coverage, args=(country, key))
+        if coverage:
+            st.caption("Changed: " + ", ".join(f"{c} {v:.1f}%" for c, v in coverage.items()))
+
+    start = time.perf_counter()
+    with timing.stage("what-if update"):
+        cells = scenario.update(coverage, variant_scale, manufacturer_scale)
+    st.caption(f"Recomputed {cells} of {scenario.values['Protection'].size} values in "
+               f"{(time.perf_counter() - start) * 1000:.1f} ms.")
+
+    variant = st.selectbox("Variant", scenario.variants, index=len(scenario.variants) - 1,
+                           key="whatif_variant")
+    j = scenario.variants.index(variant)
+    population = world["pop_est"].to_numpy(dtype=float, na_value=np.nan)
+
+    for col, measure in zip(st.columns(2), ("Protection", "Infection")):
+        now = whatif.population_average(scenario.values[measure][:, j], population)
+        before = whatif.population_average(scenario.baseline[measure][:, j], population)
+        if np.isnan(now):
+            col.metric(f"{variant} {measure}, population average", "no data")
+            continue
+        col.metric(f"{variant} {measure}, population average", f"{now:.1f}%", f"{now - before:+.1f} points",
+                   delta_color="inverse" if measure == "Infection" else "normal")
+
+    change = scenario.values["Infection"][:, j] - scenario.baseline["Infection"][:, j]
+    changed = np.flatnonzero(np.abs(np.nan_to_num(change)) > 1e-9)
+    if len(changed):
+        with timing.stage("figure: what-if"):
+            shown = changed[np.argsort(-np.abs(change[changed]))[:15]]
+            fig = go.Figure(data=[
+                go.Bar(name="Reported", x=scenario.names[shown], y=scenario.baseline["Infection"][shown, j]),
+                go.Bar(name="Scenario", x=scenario.names[shown], y=scenario.values["Infection"][shown, j]),
+            ])
+            fig.update_layout(title=f"{variant} Infection %: countries that change most", barmode="group")
+            st.plotly_chart(fig)
+    else:
+        st.info("Move a slider to compare a scenario with the reported values.")
+    with st.expander("Click here to see the scenario for every country"):
+        st.dataframe(scenario.frame(variant).dropna())
+
+timing.report()
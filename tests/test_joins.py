@@ -0,0 +1,97 @@
+"""covid.joins against the per-row ``world.loc`` loops the pages used to run."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from covid import datasets, joins
+
+
+def loop_vaccinations(world, df_vaccine, columns):
+    """Page 1's loop: one scan of the WHO table per country and column."""
+    world = world.copy()
+    for column in columns:
+        world[column] = np.nan
+    for i in range(world.shape[0]):
+        iso_code = world.loc[i]["ISO3"]
+        if iso_code in list(df_vaccine["ISO3"]):
+            for column in columns:
+                world.at[i, column] = df_vaccine[df_vaccine["ISO3"]
+                                                 == iso_code].iloc[0][joins.WHO_COLUMNS[column]]
+    return world
+
+
+def loop_efficacy(df_test, df_temp, variants=joins.EFFICACY_VARIANTS):
+    """Page 3's loop over country names."""
+    df_test = df_test.copy()
+    for v in variants:
+        df_test[f"{v} Infection Efficacy"] = np.nan
+    country_efficacy = list(df_temp.country)
+    for i in range(df_test.shape[0]):
+        country = df_test.loc[i]["name"]
+        if country in country_efficacy:
+            for v in variants:
+                df_test.at[i, f"{v} Infection Efficacy"] = df_temp[df_temp["country"]
+                                                                   == country][f"{v} Infection"].values[0]
+    return df_test
+
+
+def assert_same(new, old):
+    # the loops filled object columns with NaN and numeric ones with float64
+    old = old.astype({c: "float64" for c in old.columns
+                      if old[c].dtype == object and new[c].dtype == "float64"})
+    pd.testing.assert_frame_equal(pd.DataFrame(new), pd.DataFrame(old))
+
+
+@pytest.fixture(scope="module")
+def world():
+    world = datasets.load_naturalearth().rename(columns={"iso_a3": "ISO3"})
+    world["gdp_per_cap"] = world.gdp_md_est / world.pop_est
+    return world.reset_index(drop=True)
+
+
+@pytest.fixture(scope="module")
+def df_vaccine():
+    return datasets.load_vaccinations()
+
+
+@pytest.fixture(scope="module")
+def df_efficacy():
+    # the alias is a fix on top of the loops (see join_efficacy), so both sides get it
+    df = datasets.load_country_efficacy().reset_index(drop=True)
+    return df.assign(country=df["country"].replace(joins.COUNTRY_ALIASES))
+
+
+@pytest.mark.parametrize("columns", [list(joins.WHO_COLUMNS),
+                                     ["Persons_Fully_Vaccinated", "persons_vaccinated"]])
+def test_join_vaccinations_matches_loop(world, df_vaccine, columns):
+    assert_same(joins.join_vaccinations(world, df_vaccine, columns),
+                loop_vaccinations(world, df_vaccine, columns))
+
+
+def test_join_efficacy_matches_loop(world, df_efficacy):
+    assert_same(joins.join_efficacy(world, df_efficacy), loop_efficacy(world, df_efficacy))
+
+
+def test_enrich_world_matches_loops(world, df_vaccine, df_efficacy):
+    raw = datasets.load_naturalearth().reset_index(drop=True)
+    expected = loop_efficacy(loop_vaccinations(world, df_vaccine, list(joins.WHO_COLUMNS)), df_efficacy)
+    assert_same(joins.enrich_world(raw, df_vaccine, df_efficacy), expected)
+
+
+def test_duplicate_key_takes_first_row(world, df_vaccine):
+    first = df_vaccine[df_vaccine["ISO3"] == "FRA"]
+    second = first.assign(TOTAL_VACCINATIONS=1, VACCINES_USED="duplicate")
+    df_vaccine = pd.concat([df_vaccine, second], ignore_index=True)
+    new = joins.join_vaccinations(world, df_vaccine)
+    assert_same(new, loop_vaccinations(world, df_vaccine, list(joins.WHO_COLUMNS)))
+    assert (new.loc[new["ISO3"] == "FRA", "vaccines"] == first["VACCINES_USED"].iloc[0]).all()
+
+
+def test_missing_country_gets_nan(world, df_vaccine, df_efficacy):
+    df_vaccine = df_vaccine[df_vaccine["ISO3"] != "FRA"]
+    df_efficacy = df_efficacy[df_efficacy["country"] != "Italy"]
+    new = joins.join_efficacy(joins.join_vaccinations(world, df_vaccine), df_efficacy)
+    old = loop_efficacy(loop_vaccinations(world, df_vaccine, list(joins.WHO_COLUMNS)), df_efficacy)
+    assert_same(new, old)
+    assert new.loc[new["ISO3"] == "FRA", list(joins.WHO_COLUMNS)].isna().all().all()
+    assert new.loc[new["name"] == "Italy", "Alpha Infection Efficacy"].isna().all()
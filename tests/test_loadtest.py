@@ -0,0 +1,21 @@
+"""covid.loadtest command line."""
+import pytest
+
+from covid import loadtest
+
+
+def test_parse_args_types_values_and_selects_scripts():
+    options, scripts = loadtest.parse_args(["--sessions", "4", "--think", "0.5", "dash*"])
+    assert options == {"sessions": 4, "think": 0.5}
+    assert scripts == ["dashboard"]
+
+
+@pytest.mark.parametrize("args", [["--sessions"], ["--sessions", "many"], ["--bogus", "1"], ["nosuch"]])
+def test_parse_args_rejects(args):
+    with pytest.raises(ValueError):
+        loadtest.parse_args(args)
+
+
+def test_main_prints_usage_for_a_missing_value(capsys):
+    assert loadtest.main(["--duration"]) == 2
+    assert "usage: python -m covid.loadtest" in capsys.readouterr().err
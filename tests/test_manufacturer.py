@@ -0,0 +1,124 @@
+"""covid.manufacturer.panel against the Dashboard's zero-matrix loop it replaced."""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from covid import manufacturer, owid, schema
+
+SAMPLE = os.path.join(os.path.dirname(__file__), "data", "owid_manufacturer_sample.csv")
+
+
+def loop_panel(df_gb):
+    """The Dashboard's construction, with its two documented differences from ``panel``.
+
+    Vaccines are taken in sorted rather than set order, and the forward fill
+    starts at the second date instead of the hard-coded row 6.
+    """
+    country_opt = df_gb["location"].iloc[0]
+    n_dates = len(set(list(df_gb["date"])))
+    n_vaccines = len(set(list(df_gb["vaccine"])))
+    df_gb_modified = pd.DataFrame(np.zeros((n_dates*n_vaccines, 4)),
+                                  columns=['location', 'date', 'vaccine', 'total_vaccinations'])
+    df_gb_modified['location'] = country_opt
+
+    dates = []
+    for j in sorted(set(list(df_gb["date"]))):
+        for i in range(n_vaccines):
+            dates.append(j)
+    df_gb_modified["date"] = dates
+    vaccines = []
+    for i in range(n_dates):
+        for j in sorted(set(list(df_gb["vaccine"]))):
+            vaccines.append(j)
+    df_gb_modified['vaccine'] = vaccines
+    for i in range(len(df_gb_modified)):
+        temp_arr = df_gb[(df_gb['date'] == df_gb_modified.loc[i, 'date']) & (
+            df_gb['vaccine'] == df_gb_modified.loc[i, 'vaccine'])]["total_vaccinations"].values
+        if len(temp_arr) != 0:
+            df_gb_modified.loc[i, 'total_vaccinations'] = temp_arr[0]
+    sorted_dates = sorted(list(set(list(df_gb["date"]))))
+    for i in range(n_vaccines, len(df_gb_modified)):
+        if df_gb_modified.loc[i, "total_vaccinations"] == 0:
+            prev_date = sorted_dates[sorted_dates.index(
+                df_gb_modified.loc[i, "date"])-1]
+            df_gb_modified.loc[i, "total_vaccinations"] = df_gb_modified[(df_gb_modified['vaccine'] == df_gb_modified.loc[i, "vaccine"]) & (
+                df_gb_modified['date'] == prev_date)]["total_vaccinations"].values[0]
+    return df_gb_modified
+
+
+def assert_same(new, old):
+    assert list(new.columns) == list(old.columns)
+    assert (new["location"] == old["location"]).all()
+    assert list(pd.to_datetime(new["date"])) == list(pd.to_datetime(old["date"]))
+    assert [str(v) for v in new["vaccine"]] == [str(v) for v in old["vaccine"]]
+    np.testing.assert_array_equal(new["total_vaccinations"].to_numpy(dtype=float),
+                                  old["total_vaccinations"].to_numpy(dtype=float))
+
+
+def rows(location, dates, vaccine, totals):
+    return pd.DataFrame({"location": location, "date": dates, "vaccine": vaccine,
+                         "total_vaccinations": totals})
+
+
+SYNTHETIC = {
+    # dates missing for some vaccines, a 0 report inside a run
+    "gaps": pd.concat([
+        rows("X", ["2021-01-01", "2021-01-02", "2021-01-05", "2021-01-09"], "A", [5, 7, 0, 12]),
+        rows("X", ["2021-01-01", "2021-01-09"], "B", [1, 4]),
+        rows("X", ["2021-01-02", "2021-01-05"], "C", [2, 3]),
+    ]),
+    # a vaccine whose first report comes after the others'
+    "late start": pd.concat([
+        rows("Y", ["2021-03-01", "2021-03-02", "2021-03-03", "2021-03-04"], "Early", [10, 20, 30, 40]),
+        rows("Y", ["2021-03-03", "2021-03-04"], "Late", [1, 2]),
+    ]),
+    "single vaccine": rows("Z", ["2021-05-01", "2021-05-03", "2021-05-02", "2021-05-04"], "Only",
+                           [3, 0, 2, 9]),
+}
+
+
+def sample():
+    return pd.read_csv(SAMPLE)
+
+
+@pytest.mark.parametrize("location", ["Argentina", "South Korea"])
+def test_panel_matches_loop_on_snapshot_rows(location):
+    df_gb = sample()
+    df_gb = df_gb[df_gb["location"] == location]
+    assert_same(manufacturer.panel(df_gb), loop_panel(df_gb))
+
+
+@pytest.mark.parametrize("name", list(SYNTHETIC))
+def test_panel_matches_loop_on_synthetic_rows(name):
+    df_gb = SYNTHETIC[name].reset_index(drop=True)
+    assert_same(manufacturer.panel(df_gb), loop_panel(df_gb))
+
+
+@pytest.mark.parametrize("counts", [None, "UInt32"])
+@pytest.mark.parametrize("name", list(SYNTHETIC) + ["Argentina", "South Korea"])
+def test_panel_of_compact_partition_matches_loop(tmp_path, name, counts):
+    """Rows as the Dashboard gets them: compact dtypes, read back from the partitioned file.
+
+    The compact counts are plain unsigned integers when nothing is missing;
+    "UInt32" is the nullable type they get when something is.
+    """
+    frame = pd.concat([sample()] + list(SYNTHETIC.values()), ignore_index=True)
+    location = SYNTHETIC[name]["location"].iloc[0] if name in SYNTHETIC else name
+    compact = schema.compact(frame, "owid_manufacturer")
+    if counts:
+        compact = compact.astype({"total_vaccinations": counts})
+    path = str(tmp_path / "partitions.arrow")
+    manufacturer.write_partitions(compact, path, "digest")
+    df_gb = manufacturer.read_partition(path, location)
+    assert_same(manufacturer.panel(df_gb), loop_panel(frame[frame["location"] == location]))
+
+
+@pytest.mark.skipif(not os.path.exists(owid.SNAPSHOT), reason="no OWID snapshot in the cache")
+def test_panel_matches_loop_on_full_snapshot():
+    feed = pd.read_csv(owid.SNAPSHOT)
+    for location in ["South Korea", "Argentina", "Germany"]:
+        df_gb = feed[feed["location"] == location]
+        if len(df_gb):
+            assert_same(manufacturer.panel(df_gb), loop_panel(df_gb))
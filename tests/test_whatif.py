@@ -0,0 +1,17 @@
+"""covid.whatif helpers."""
+import numpy as np
+
+from covid import whatif
+
+
+def test_population_average_weights_known_countries():
+    values = np.array([10.0, np.nan, 40.0, 5.0])
+    population = np.array([1.0, 5.0, 3.0, np.nan])
+    assert whatif.population_average(values, population) == 32.5
+
+
+def test_population_average_without_known_values_is_nan():
+    population = np.array([1.0, 2.0])
+    assert np.isnan(whatif.population_average(np.array([np.nan, np.nan]), population))
+    assert np.isnan(whatif.population_average(np.array([1.0, 2.0]), np.array([np.nan, 0.0])))
+    assert np.isnan(whatif.population_average(np.array([]), np.array([])))